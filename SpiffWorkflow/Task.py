@@ -15,12 +15,24 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 import logging
 import time
+import zlib
 
 from SpiffWorkflow.exceptions import WorkflowException
 
 LOG = logging.getLogger(__name__)
 
 
+def _get_name_bit(name):
+    """
+    Returns the bit that stands for the given task spec name in the
+    ancestor masks of the tasks. Names may share a bit, so a set bit only
+    means that a task spec with the name may be among the ancestors.
+    """
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return 1 << (zlib.crc32(name) % 63)
+
+
 class Task(object):
     """
     Used internally for composing a tree that represents the path that
@@ -95,6 +107,57 @@ class Task(object):
                    LIKELY:    'LIKELY',
                    MAYBE:     'MAYBE'}
 
+    # The amount of history that is recorded for each task. See
+    # Workflow.history.
+    HISTORY_NONE   = 0  # Only the current state.
+    HISTORY_STATES = 1  # Every state in state_history.
+    HISTORY_LOG    = 2  # Like HISTORY_STATES, plus messages in log.
+
+    # Which tasks are predicted ahead of time. See Workflow.prediction.
+    PREDICT_ALL      = 0  # All possible routes, up to the lookahead.
+    PREDICT_DEFINITE = 1  # Only the FUTURE routes, and their next steps.
+
+    # Tasks are created in large numbers, so they do not carry a
+    # per-instance __dict__ unless some other code attaches additional
+    # attributes. The history, the log, and the internal attributes are
+    # only allocated once they are needed.
+    # The attributes dict is shared copy-on-write: a child that inherits
+    # from its parent references the parent's dict until either of them
+    # writes to it.
+    # Every task also knows which states occur in its subtree, so that
+    # searches for a state can skip branches that do not contain it.
+    # For ancestor lookups, each task stores its depth and a pointer to
+    # an ancestor further up the tree (a skew-binary jump pointer), which
+    # allows for finding the ancestor at any depth in logarithmic time.
+    # The task also has a mask of the task specs of the ancestors that the
+    # jump pointer skips, so that the closest ancestor with a given task
+    # spec is found in logarithmic time as well.
+    __slots__ = ('workflow',
+                 'parent',
+                 'children',
+                 '_state',
+                 'triggered',
+                 '_state_history',
+                 '_log',
+                 'task_spec',
+                 'id',
+                 '_thread_id',
+                 'last_state_change',
+                 '_attributes',
+                 '_attributes_shared',
+                 '_internal_attributes',
+                 '_subtree_mask',
+                 '_child_masks',
+                 '_in_parent',
+                 '_depth',
+                 '_jump',
+                 '_ancestor_mask',
+                 '_prediction_state',
+                 '_prepared',
+                 '_array_slot',
+                 '__dict__',
+                 '__weakref__')
+
     class Iterator(object):
         """
         This is a tree iterator that supports filtering such that a client
@@ -105,55 +168,74 @@ class Task(object):
             Constructor.
             """
             self.filter = filter
-            self.path = [current]
+            # The path from the start task to the next task to visit,
+            # together with the position of each task in its parent's
+            # list of children. Knowing the position makes finding the
+            # next sibling a constant time operation.
+            self.path      = [current]
+            self.positions = [0]
 
         def __iter__(self):
             return self
 
-        def _next(self):
-            # Make sure that the end is not yet reached.
-            if len(self.path) == 0:
-                raise StopIteration()
-
-            # If the current task has children, the first child is the next item.
-            # If the current task is LIKELY, and predicted tasks are not
-            # specificly searched, we can ignore the children, because predicted
-            # tasks should only have predicted children.
-            current = self.path[-1]
-            ignore_task = False
-            if self.filter is not None:
-                search_predicted = self.filter & Task.LIKELY != 0
-                is_predicted = current.state & Task.LIKELY != 0
-                ignore_task = is_predicted and not search_predicted
-            if current.children and not ignore_task:
-                self.path.append(current.children[0])
-                if self.filter is not None and current.state & self.filter == 0:
-                    return None
-                return current
-
-            # Ending up here, this task has no children. Crop the path until we
-            # reach a task that has unvisited children, or until we hit the end.
-            while True:
-                old_child = self.path.pop(-1)
-                if len(self.path) == 0:
-                    break
-
-                # If this task has a sibling, choose it.
-                parent = self.path[-1]
-                pos = parent.children.index(old_child)
-                if len(parent.children) > pos + 1:
-                    self.path.append(parent.children[pos + 1])
-                    break
-            if self.filter is not None and current.state & self.filter == 0:
-                return None
-            return current
+        def _push_first_match(self, parent, pos):
+            """
+            Descends into the first child of the given parent, beginning at
+            the given position, whose subtree may contain a match.
+            Returns False if there is no such child.
+            """
+            siblings = parent.children
+            n_siblings = len(siblings)
+            filter = self.filter
+            if filter is not None:
+                while pos < n_siblings and siblings[pos]._subtree_mask & filter == 0:
+                    pos += 1
+            if pos >= n_siblings:
+                return False
+            self.path.append(siblings[pos])
+            self.positions.append(pos)
+            return True
 
         def next(self):
-            # By using this loop we avoid an (expensive) recursive call.
-            while True:
-                next = self._next()
-                if next is not None:
-                    return next
+            path      = self.path
+            positions = self.positions
+            filter    = self.filter
+            if filter is None:
+                skip_predicted = False
+            else:
+                skip_predicted = filter & Task.LIKELY == 0
+
+            while path:
+                current = path[-1]
+
+                # If the current task has children, the first child is the
+                # next item. If the current task is LIKELY, and predicted
+                # tasks are not specificly searched, we can ignore the
+                # children, because predicted tasks should only have
+                # predicted children. Children whose subtree does not
+                # contain any of the searched states are skipped as well.
+                if (skip_predicted and current._state & Task.LIKELY != 0) \
+                  or not self._push_first_match(current, 0):
+                    # Crop the path until we reach a task that has
+                    # unvisited children, or until we hit the end.
+                    while True:
+                        old_child = path.pop()
+                        pos       = positions.pop()
+                        if not path:
+                            break
+
+                        # If this task has a sibling, choose it. The
+                        # children may have changed since we descended,
+                        # in which case the position must be looked up.
+                        siblings = path[-1].children
+                        if pos >= len(siblings) or siblings[pos] is not old_child:
+                            pos = siblings.index(old_child)
+                        if self._push_first_match(path[-1], pos + 1):
+                            break
+
+                if filter is None or current._state & filter != 0:
+                    return current
+            raise StopIteration()
 
 
     # Pool for assigning a unique thread id to every new Task.
@@ -169,15 +251,24 @@ class Task(object):
         self.parent              = parent
         self.children            = []
         self._state              = state
-        self.triggered           = False
-        self.state_history       = [state]
-        self.log                 = []
-        self.task_spec           = task_spec
-        self.id                  = workflow.task_id_assigner.get_new_id()
-        self.thread_id           = self.__class__.thread_id_pool
-        self.last_state_change   = time.time()
-        self.attributes          = {}
-        self.internal_attributes = {}
+        self.triggered            = False
+        self._state_history       = None
+        self._log                 = None
+        self.task_spec            = task_spec
+        self.id                   = workflow.task_id_assigner.get_new_id()
+        self._thread_id           = self.__class__.thread_id_pool
+        self.last_state_change    = time.time()
+        self._attributes          = {}
+        self._attributes_shared   = False
+        self._internal_attributes = None
+        self._subtree_mask        = state
+        self._child_masks         = None
+        self._in_parent           = False
+        self._prediction_state    = None
+        self._prepared            = False
+        self._array_slot          = None
+        self._link_ancestry()
+        workflow._task_added_notify(self)
         if parent is not None:
             self.parent._child_added_notify(self)
 
@@ -202,64 +293,366 @@ class Task(object):
                                     'state went from %s to %s!' % (
                                         self.get_state_name(),
                                         self.state_names[value]))
-        if __debug__:
-            old = self.get_state_name()
+        self._invalidate_prediction()
+        old_state = self._state
         self._state = value
-        if __debug__:
-            self.log.append("Moving '%s' from %s to %s" % (self.get_name(),
-                    old, self.get_state_name()))
-        self.state_history.append(value)
-        LOG.debug("Moving '%s' (spec=%s) from %s to %s" % (self.get_name(),
-                    self.task_spec.name, old, self.get_state_name()))
+        self._refresh_subtree_mask()
+        self.workflow._task_state_changed_notify(self, old_state)
+
+        history = self.workflow.history
+        if history >= self.HISTORY_STATES:
+            if self._state_history is None:
+                self._state_history = [old_state]
+            self._state_history.append(value)
+        if history >= self.HISTORY_LOG:
+            if self._log is None:
+                self._log = []
+            self._log.append("Moving '%s' from %s to %s" % (self.get_name(),
+                    self.state_names[old_state], self.get_state_name()))
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("Moving '%s' (spec=%s) from %s to %s" % (
+                    self.get_name(), self.task_spec.name,
+                    self.state_names[old_state], self.get_state_name()))
 
     def _delstate(self):
         del self._state
 
     state = property(_getstate, _setstate, _delstate, "State property.")
 
+    def _get_state_history(self):
+        if self._state_history is None:
+            return [self._state]
+        return self._state_history
+
+    def _set_state_history(self, value):
+        self._state_history = value
+
+    state_history = property(_get_state_history,
+                             _set_state_history,
+                             doc="The list of states this task went through.")
+
+    def _get_log(self):
+        if self._log is None:
+            self._log = []
+        return self._log
+
+    def _set_log(self, value):
+        self._log = value
+
+    log = property(_get_log, _set_log, doc="Messages about state changes.")
+
+    def _get_attributes(self):
+        # The caller may modify the returned dict, so it must be our own.
+        self._unshare_attributes()
+        self._invalidate_prediction()
+        return self._attributes
+
+    def _set_attributes(self, value):
+        self._invalidate_prediction()
+        self._attributes        = value
+        self._attributes_shared = False
+
+    attributes = property(_get_attributes,
+                          _set_attributes,
+                          doc="The data attached to this task.")
+
+    def _get_thread_id(self):
+        return self._thread_id
+
+    def _set_thread_id(self, value):
+        old_thread_id = self._thread_id
+        if old_thread_id == value:
+            return
+        self._thread_id = value
+        self.workflow._task_thread_changed_notify(self, old_thread_id)
+
+    thread_id = property(_get_thread_id,
+                         _set_thread_id,
+                         doc="The id of the thread of control.")
+
+    def _get_internal_attributes(self):
+        if self._internal_attributes is None:
+            self._internal_attributes = {}
+        return self._internal_attributes
+
+    def _set_internal_attributes(self, value):
+        self._internal_attributes = value
+
+    internal_attributes = property(_get_internal_attributes,
+                                   _set_internal_attributes,
+                                   doc="Attributes used by the task spec.")
+
     def __iter__(self):
         return Task.Iterator(self)
 
+    def __getstate__(self):
+        # The result of TaskSpec._prepare() is not saved, so a task that
+        # is unpickled is prepared again when it is completed.
+        state = {}
+        for name in self.__slots__:
+            if name in ('__dict__', '__weakref__', '_prepared'):
+                continue
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        state.update(self.__dict__)
+        return state
+
+    # Pickles that were made before the task used slots carry a plain
+    # __dict__, in which some of the slots have a public name.
+    _legacy_names = {'thread_id':           '_thread_id',
+                     'state_history':       '_state_history',
+                     'log':                 '_log',
+                     'attributes':          '_attributes',
+                     'internal_attributes': '_internal_attributes'}
+
+    # The defaults of the slots that older pickles may not include. The
+    # depth, the jump pointer, and the subtree mask are recomputed by
+    # the Workflow once the whole tree was unpickled.
+    _slot_defaults = {'_attributes_shared': False,
+                      '_subtree_mask':      0,
+                      '_child_masks':       None,
+                      '_in_parent':         False,
+                      '_depth':             0,
+                      '_jump':              None,
+                      '_ancestor_mask':     -1,
+                      '_prediction_state':  None,
+                      '_prepared':          False,
+                      '_array_slot':        None}
+
     def __setstate__(self, dict):
-        self.__dict__.update(dict)
+        for name, value in self._slot_defaults.iteritems():
+            setattr(self, name, value)
+        for name, value in dict.iteritems():
+            setattr(self, self._legacy_names.get(name, name), value)
         # If unpickled in the same Python process in which a workflow
         # (Task) is built through the API, we need to make sure
         # that there will not be any ID collisions.
-        if dict['thread_id'] >= self.__class__.thread_id_pool:
-            self.__class__.thread_id_pool = dict['thread_id']
+        if self._thread_id >= self.__class__.thread_id_pool:
+            self.__class__.thread_id_pool = self._thread_id
+
+    def _link_ancestry(self):
+        """
+        Computes the depth and the jump pointer from those of the parent.
+        The jump pointer skips 2^k-1 ancestors for some k, such that any
+        ancestor can be reached in O(log(depth)) steps. The ancestor mask
+        has the bits of the names of the task specs of the ancestors from
+        the parent up to and including the jump target.
+        """
+        parent = self.parent
+        if parent is None:
+            self._depth         = 0
+            self._jump          = self
+            self._ancestor_mask = 0
+            return
+        self._depth = parent._depth + 1
+        jump = parent._jump
+        mask = _get_name_bit(parent.task_spec.name)
+        if parent._depth - jump._depth == jump._depth - jump._jump._depth:
+            self._jump = jump._jump
+            mask |= parent._ancestor_mask | jump._ancestor_mask
+        else:
+            self._jump = parent
+        self._ancestor_mask = mask
+
+    def _update_ancestry(self):
+        """
+        Recomputes the depth and jump pointers of this task and all of its
+        descendants. Must be called after the task was moved to another
+        parent.
+        """
+        for task in Task.Iterator(self):
+            task._link_ancestry()
+
+    def _get_ancestor_at_depth(self, depth):
+        """
+        Returns the ancestor at the given depth, or the task itself if the
+        depth is equal to the depth of this task.
+        """
+        task = self
+        while task._depth > depth:
+            if task._jump._depth >= depth:
+                task = task._jump
+            else:
+                task = task.parent
+        return task
 
     def _get_root(self):
         """
         Returns the top level parent.
         """
-        if self.parent is None:
-            return self
-        return self.parent._get_root()
+        return self._get_ancestor_at_depth(0)
 
     def _get_depth(self):
-        depth = 0
-        task = self.parent
-        while task is not None:
-            depth += 1
-            task = task.parent
-        return depth
+        return self._depth
 
     def _child_added_notify(self, child):
         """
         Called by another Task to let us know that a child was added.
         """
         assert child is not None
+        self._invalidate_prediction()
         self.children.append(child)
+        self._count_child(child)
+
+    def _insert_child(self, index, child):
+        """
+        Moves the given task into the list of children at the given
+        position. Used to integrate the tree of a subworkflow.
+        """
+        child.parent = self
+        child._update_ancestry()
+        self._invalidate_prediction()
+        self.children.insert(index, child)
+        self._count_child(child)
+
+    def _remove_child(self, child):
+        """
+        Removes the given child, including all of its descendants, from
+        the tree.
+        """
+        self._remove_children([child])
+
+    def _remove_children(self, children):
+        """
+        Like _remove_child(), but removes all of the given children at
+        once.
+        """
+        self._invalidate_prediction()
+        remove = set(children)
+        self.children[:] = [c for c in self.children if c not in remove]
+        for child in children:
+            if child._in_parent:
+                child._in_parent = False
+                self._update_child_masks(child._subtree_mask, 0)
+            child._unregister()
+        self._refresh_subtree_mask()
+
+    def _count_child(self, child):
+        """
+        Includes the states of the given child's subtree in our own.
+        """
+        child._in_parent = True
+        self._update_child_masks(0, child._subtree_mask)
+        self._refresh_subtree_mask()
+
+    def _recount_children(self):
+        """
+        Rebuilds the subtree mask from the children, for trees that were
+        assembled without going through _child_added_notify().
+        """
+        self._child_masks = None
+        for child in self.children:
+            child._in_parent = True
+            self._update_child_masks(0, child._subtree_mask)
+        self._refresh_subtree_mask()
+
+    def _update_child_masks(self, old_mask, new_mask):
+        """
+        Called when the subtree mask of one of our children changed.
+        For each state, we count the children whose subtree has it.
+        """
+        counts = self._child_masks
+        if counts is None:
+            counts = self._child_masks = {}
+        changed = old_mask ^ new_mask
+        for state in self.state_names:
+            if changed & state == 0:
+                continue
+            if new_mask & state:
+                counts[state] = counts.get(state, 0) + 1
+            else:
+                counts[state] -= 1
+
+    def _refresh_subtree_mask(self):
+        """
+        Recomputes the mask of the states in this subtree, and passes
+        any change on to the ancestors.
+        """
+        task = self
+        while True:
+            mask = task._state
+            if task._child_masks:
+                for state, count in task._child_masks.iteritems():
+                    if count:
+                        mask |= state
+            old_mask = task._subtree_mask
+            if mask == old_mask:
+                return
+            task._subtree_mask = mask
+            if not task._in_parent:
+                return
+            task = task.parent
+            task._update_child_masks(old_mask, mask)
+
+    def _unregister(self):
+        """
+        Removes this task and all of its descendants from the lookup
+        tables of the workflow. Called when the branch was removed from
+        the tree.
+        """
+        for task in Task.Iterator(self):
+            task.workflow._task_removed_notify(task)
+
+    def _find_unfinished_descendants(self):
+        """
+        Returns the unfinished descendants that can be reached through
+        finished tasks only, in the order of Task.Iterator.
+        """
+        result = []
+        stack = self.children[::-1]
+        while stack:
+            task = stack.pop()
+            if task._is_finished():
+                stack.extend(task.children[::-1])
+            else:
+                result.append(task)
+        return result
+
+    @classmethod
+    def _drop_tasks(cls, tasks):
+        """
+        Removes the given tasks from the tree, removing all children of
+        the same parent at once.
+        """
+        parents = []
+        children = {}
+        for task in tasks:
+            if task.parent not in children:
+                parents.append(task.parent)
+                children[task.parent] = []
+            children[task.parent].append(task)
+        for parent in parents:
+            parent._remove_children(children[parent])
 
     def _drop_children(self):
+        self._drop_tasks(self._find_unfinished_descendants())
+
+    @classmethod
+    def _cancel_tasks(cls, tasks):
+        """
+        Cancels the given unfinished tasks in one batch. Unfinished tasks
+        below them are removed from the tree, as in _drop_children().
+        All states are changed before any cancel hook is called.
+
+        :type  tasks: list(Task)
+        :param tasks: The tasks to cancel.
+        """
+        # Find the branches to drop before any state is changed, and
+        # skip tasks that are in a dropped branch already.
         drop = []
-        for child in self.children:
-            if not child._is_finished():
+        dropped = set()
+        for task in tasks:
+            if task in dropped:
+                continue
+            for child in task._find_unfinished_descendants():
                 drop.append(child)
-            else:
-                child._drop_children()
-        for task in drop:
-            self.children.remove(task)
+                dropped.update(Task.Iterator(child))
+        cls._drop_tasks(drop)
+
+        for task in tasks:
+            task._set_state(cls.CANCELLED)
+        for task in tasks:
+            task.task_spec._on_cancel(task)
 
     def _set_state(self, state, force=True):
         """
@@ -269,6 +662,20 @@ class Task(object):
         self._setstate(state, True)
         self.last_state_change = time.time()
 
+    def _invalidate_prediction(self):
+        """
+        Called before the state, the children or the attributes of this
+        task change. Forgets the remembered prediction of this task, and
+        of all MAYBE and LIKELY tasks above it, because their predicted
+        branches include this task (see TaskSpec._predict()).
+        """
+        task = self
+        while task is not None:
+            task._prediction_state = None
+            if task._state & (self.LIKELY | self.MAYBE) == 0:
+                break
+            task = task.parent
+
     def _has_state(self, state):
         """
         Returns True if the Task has the given state flag set.
@@ -346,9 +753,14 @@ class Task(object):
         LOG.debug("Updating children for %s" % self.get_name())
         if task_specs is None:
             raise ValueError('"task_specs" argument is None')
-        add = task_specs[:]
+
+        # Count how many children are wanted for each spec.
+        wanted = {}
+        for task_spec in task_specs:
+            wanted[task_spec] = wanted.get(task_spec, 0) + 1
 
         # Create a list of all children that are no longer needed.
+        matched = {}
         remove = []
         for child in self.children:
             # Triggered tasks are never removed.
@@ -356,8 +768,9 @@ class Task(object):
                 continue
 
             # Check whether the task needs to be removed.
-            if child.task_spec in add:
-                add.remove(child.task_spec)
+            if wanted.get(child.task_spec, 0) > 0:
+                wanted[child.task_spec] -= 1
+                matched[child.task_spec] = matched.get(child.task_spec, 0) + 1
                 continue
 
             # Non-predicted tasks must not be removed, so they HAVE to be in
@@ -367,10 +780,14 @@ class Task(object):
                     'removal of non-predicted child %s' % repr(child))
             remove.append(child)
 
-        # Remove and add the children accordingly.
-        for child in remove:
-            self.children.remove(child)
-        for task_spec in add:
+        # Remove and add the children accordingly. The existing children
+        # stand for the first occurrences of their spec in the list.
+        if remove:
+            self._remove_children(remove)
+        for task_spec in task_specs:
+            if matched.get(task_spec, 0) > 0:
+                matched[task_spec] -= 1
+                continue
             self._add_child(task_spec, state)
 
     def _set_likely_task(self, task_specs):
@@ -395,11 +812,9 @@ class Task(object):
         :rtype:  boolean
         :returns: Whether the parent was found.
         """
-        if self.parent is None:
+        if parent._depth >= self._depth:
             return False
-        if self.parent == parent:
-            return True
-        return self.parent._is_descendant_of(parent)
+        return self._get_ancestor_at_depth(parent._depth) is parent
 
     def _find_child_of(self, parent_task_spec):
         """
@@ -412,11 +827,12 @@ class Task(object):
         :rtype:  Task
         :returns: The child of the given ancestor.
         """
-        if self.parent is None:
-            return self
-        if self.parent.task_spec == parent_task_spec:
-            return self
-        return self.parent._find_child_of(parent_task_spec)
+        ancestor = self._find_closest_ancestor(
+            parent_task_spec.name,
+            lambda task: task.task_spec == parent_task_spec)
+        if ancestor is None:
+            return self._get_root()
+        return self._get_ancestor_at_depth(ancestor._depth + 1)
 
     def _find_any(self, task_spec):
         """
@@ -446,11 +862,12 @@ class Task(object):
         :rtype:  Task
         :returns: The ancestor.
         """
-        if self.parent is None:
-            return self
-        if self.parent.task_spec == task_spec:
-            return self.parent
-        return self.parent._find_ancestor(task_spec)
+        ancestor = self._find_closest_ancestor(
+            task_spec.name,
+            lambda task: task.task_spec == task_spec)
+        if ancestor is None:
+            return self._get_root()
+        return ancestor
 
     def _find_ancestor_from_name(self, name):
         """
@@ -462,11 +879,35 @@ class Task(object):
         :rtype:  Task
         :returns: The ancestor.
         """
-        if self.parent is None:
-            return None
-        if self.parent.get_name() == name:
-            return self.parent
-        return self.parent._find_ancestor_from_name(name)
+        return self._find_closest_ancestor(
+            name,
+            lambda task: task.get_name() == name)
+
+    def _find_closest_ancestor(self, name, matches):
+        """
+        Returns the closest ancestor for which matches() returns True, or
+        None. Only ancestors whose task spec has the given name may match.
+        The jump pointers skip the ancestors whose task specs do not have
+        the bit of that name in their mask, see _link_ancestry().
+
+        :type  name: str
+        :param name: The name of the task spec of the wanted ancestor.
+        :type  matches: callable
+        :param matches: Returns True for the wanted ancestor.
+        :rtype:  Task
+        :returns: The ancestor, or None.
+        """
+        bit  = _get_name_bit(name)
+        task = self
+        while task.parent is not None:
+            parent = task.parent
+            if matches(parent):
+                return parent
+            if task._ancestor_mask & bit:
+                task = parent
+            else:
+                task = task._jump
+        return None
 
     def _ready(self):
         """
@@ -474,7 +915,12 @@ class Task(object):
         """
         if self._has_state(self.COMPLETED) or self._has_state(self.CANCELLED):
             return
+        was_predicted = not self._is_definite()
         self._set_state(self.READY)
+        # Unless all predictions are made, the children of a MAYBE or
+        # LIKELY task may not have been added yet.
+        if was_predicted and self.workflow.prediction != Task.PREDICT_ALL:
+            self.task_spec._predict(self)
         self.task_spec._on_ready(self)
 
     def get_name(self):
@@ -529,22 +975,54 @@ class Task(object):
         self.internal_attributes.update(kwargs)
 
     def _get_internal_attribute(self, name, default=None):
-        return self.internal_attributes.get(name, default)
+        if self._internal_attributes is None:
+            return default
+        return self._internal_attributes.get(name, default)
+
+    def _unshare_attributes(self):
+        """
+        Makes sure that the attributes dict is not referenced by any
+        other task, copying it if needed.
+        """
+        if self._attributes_shared:
+            self._attributes        = dict(self._attributes)
+            self._attributes_shared = False
+
+    def _peek_attributes(self):
+        """
+        Like get_attributes(), but without copying a shared dict. The
+        result must not be modified.
+        """
+        return self._attributes
 
     def set_attribute(self, **kwargs):
         """
         Defines the given attribute/value pairs.
         """
-        self.attributes.update(kwargs)
+        self._unshare_attributes()
+        self._invalidate_prediction()
+        self._attributes.update(kwargs)
 
     def _inherit_attributes(self):
         """
         Inherits the attributes from the parent.
         """
-        LOG.debug("'%s' inheriting attributes from '%s'" % (self.get_name(),
-                self.parent.get_name()),
-                extra=dict(data=self.parent.attributes))
-        self.set_attribute(**self.parent.attributes)
+        parent = self.parent
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug("'%s' inheriting attributes from '%s'" % (
+                    self.get_name(), parent.get_name()),
+                    extra=dict(data=parent._attributes))
+        if self._attributes is parent._attributes:
+            return
+        if self._attributes:
+            self.set_attribute(**parent._attributes)
+            return
+        # Nothing of our own yet, so we can share the parent's dict
+        # until one of us writes to it.
+        self._invalidate_prediction()
+        self._attributes          = parent._attributes
+        self._attributes_shared   = True
+        parent._attributes_shared = True
 
     def get_attribute(self, name, default=None):
         """
@@ -558,7 +1036,7 @@ class Task(object):
         :rtype:  obj
         :returns: The value of the attribute.
         """
-        return self.attributes.get(name, default)
+        return self._attributes.get(name, default)
 
     def get_attributes(self):
         return self.attributes
@@ -568,13 +1046,10 @@ class Task(object):
         Cancels the item if it was not yet completed, and removes
         any children that are LIKELY.
         """
-        if self._is_finished():
-            for child in self.children:
-                child.cancel()
+        if not self._is_finished():
+            self._cancel_tasks([self])
             return
-        self._set_state(self.CANCELLED)
-        self._drop_children()
-        self.task_spec._on_cancel(self)
+        self._cancel_tasks(self._find_unfinished_descendants())
 
     def complete(self):
         """
@@ -0,0 +1,122 @@
+# Copyright (C) 2007 Samuel Abels
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    have_numpy = False
+else:
+    have_numpy = True
+
+
+class TaskArray(object):
+    """
+    Keeps the states of the tasks of a workflow in parallel arrays: one
+    byte per task holds its state, and a list holds the Task object in
+    the same slot. A state query is a single scan over the bytes, which
+    is vectorized if NumPy is installed.
+
+    Each task stores its slot, and the slots of removed tasks are reused,
+    so adding, removing, and updating a task takes constant time.
+    """
+
+    def __init__(self):
+        self.states = array('B')
+        self.tasks = []
+        self._free_slots = []
+
+    def __len__(self):
+        return len(self.tasks) - len(self._free_slots)
+
+    def add(self, task):
+        """
+        Adds the given task in its current state.
+
+        :type  task: Task
+        :param task: The task to add.
+        """
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self.tasks[slot] = task
+            self.states[slot] = task._state
+        else:
+            slot = len(self.tasks)
+            self.tasks.append(task)
+            self.states.append(task._state)
+        task._array_slot = slot
+
+    def remove(self, task):
+        """
+        Removes the given task.
+
+        :type  task: Task
+        :param task: The task to remove.
+        """
+        slot = task._array_slot
+        self.tasks[slot] = None
+        self.states[slot] = 0
+        self._free_slots.append(slot)
+        task._array_slot = None
+
+    def update(self, task):
+        """
+        Records the current state of the given task.
+
+        :type  task: Task
+        :param task: The task whose state was changed.
+        """
+        self.states[task._array_slot] = task._state
+
+    def _get_states(self):
+        # A view on the bytes. It must not be kept, because the array
+        # may move when it grows.
+        return numpy.frombuffer(self.states, dtype = numpy.uint8)
+
+    def find(self, state):
+        """
+        Returns the set of tasks that have the given state.
+
+        :type  state: integer
+        :param state: A bitmask of states.
+        :rtype:  set(Task)
+        :returns: The tasks with the given state.
+        """
+        tasks = self.tasks
+        if not have_numpy:
+            return set(tasks[slot]
+                       for slot, task_state in enumerate(self.states)
+                       if task_state & state != 0)
+        if not tasks:
+            return set()
+        slots = numpy.flatnonzero(self._get_states() & state)
+        return set(tasks[slot] for slot in slots.tolist())
+
+    def count(self, state):
+        """
+        Returns the number of tasks that have the given state.
+
+        :type  state: integer
+        :param state: A bitmask of states.
+        :rtype:  integer
+        :returns: The number of tasks with the given state.
+        """
+        if not have_numpy:
+            return sum(1 for task_state in self.states
+                       if task_state & state != 0)
+        if not self.tasks:
+            return 0
+        return int(numpy.count_nonzero(self._get_states() & state))
@@ -14,11 +14,14 @@
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 import logging
+import time
+from collections import deque
 from mutex import mutex
 from SpiffWorkflow.exceptions import WorkflowException
 from SpiffWorkflow import specs
 from SpiffWorkflow.util.event import Event
 from Task import Task
+from TaskArray import TaskArray
 
 LOG = logging.getLogger(__name__)
 
@@ -32,6 +35,40 @@ class TaskIdAssigner(object):
         return self.id_pool
 
 
+class StepBudget(object):
+    """
+    Limits the number of steps, and the wall clock time, of a run. The
+    time limit only ends a run once at least one step was made, so that
+    every run makes progress.
+    """
+
+    def __init__(self, max_steps=None, timeout=None):
+        """
+        Constructor.
+
+        :type  max_steps: integer
+        :param max_steps: The maximum number of steps, or None.
+        :type  timeout: float
+        :param timeout: The maximum number of seconds, or None.
+        """
+        self.max_steps = max_steps
+        self.steps = 0
+        if timeout is None:
+            self.deadline = None
+        else:
+            self.deadline = time.time() + timeout
+
+    def is_exhausted(self):
+        """
+        Returns True if no further step may be made.
+        """
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            return True
+        if self.deadline is None or self.steps == 0:
+            return False
+        return time.time() >= self.deadline
+
+
 class Workflow(object):
     """
     The engine that executes a workflow.
@@ -46,6 +83,29 @@ class Workflow(object):
         :param deserializing: set to true when deserializing to avoid
         generating tasks twice (and associated problems with multiple
         hierarchies of tasks)
+        :type  history: int
+        :param history: How much history is recorded for each task; one of
+        Task.HISTORY_NONE, Task.HISTORY_STATES or Task.HISTORY_LOG.
+        Defaults to the setting of the parent workflow, or to
+        HISTORY_LOG when running in debug mode.
+        :type  prediction: int
+        :param prediction: Which tasks are predicted; Task.PREDICT_ALL
+        adds MAYBE and LIKELY tasks for all possible routes, up to the
+        lookahead of each task spec. Task.PREDICT_DEFINITE follows the
+        FUTURE routes only, and adds the MAYBE and LIKELY tasks that may
+        come next, but does not predict any further. See also predict().
+        Defaults to the setting of the parent workflow, or to
+        PREDICT_ALL.
+        :type  ready_queue: bool
+        :param ready_queue: When True, complete_next() takes READY tasks
+        from a queue in the order in which they became ready, instead of
+        searching the task tree in depth-first order.
+        :type  task_array: bool
+        :param task_array: When True, the states of the tasks are kept in
+        a TaskArray instead of one set per state, which takes less memory
+        in large workflows. State queries then scan the array, vectorized
+        if NumPy is installed. Defaults to the setting of the parent
+        workflow, or to False.
         """
         assert workflow_spec is not None
         LOG.debug("__init__ Workflow instance: %s" % self.__str__())
@@ -53,8 +113,49 @@ class Workflow(object):
         self.task_id_assigner = TaskIdAssigner()
         self.attributes = {}
         self.outer_workflow = kwargs.get('parent', self)
+        if 'history' in kwargs:
+            self.history = kwargs['history']
+        elif self.outer_workflow is not self:
+            self.history = self.outer_workflow.history
+        elif __debug__:
+            self.history = Task.HISTORY_LOG
+        else:
+            self.history = Task.HISTORY_STATES
+        if 'prediction' in kwargs:
+            self.prediction = kwargs['prediction']
+        elif self.outer_workflow is not self:
+            self.prediction = self.outer_workflow.prediction
+        else:
+            self.prediction = Task.PREDICT_ALL
         self.locks = {}
         self.last_task = None
+        if 'task_array' in kwargs:
+            task_array = kwargs['task_array']
+        elif self.outer_workflow is not self:
+            task_array = self.outer_workflow._task_array is not None
+        else:
+            task_array = False
+        if task_array:
+            self._task_array = TaskArray()
+            self._tasks_by_state = None
+        else:
+            self._task_array = None
+            self._tasks_by_state = dict((state, set())
+                                        for state in Task.state_names)
+        self._task_map = {}
+        self._tasks_by_thread = {}
+        self._tokens = {}
+        self._token_keys = {}
+        self._subworkflows = []
+        self._finished_subworkflows = []
+        self._merged_into = None
+        self._unfinished_count = 0
+        self._completed_specs = set()
+        self.task_tree = None
+        if kwargs.get('ready_queue', False):
+            self._ready_queue = deque()
+        else:
+            self._ready_queue = None
         if deserializing:
             assert 'Root' in workflow_spec.task_specs
             root = workflow_spec.task_specs['Root']  # Probably deserialized
@@ -83,29 +184,504 @@ class Workflow(object):
         """
         Returns True if the entire Workflow is completed, False otherwise.
         """
-        mask = Task.NOT_FINISHED_MASK
-        iter = Task.Iterator(self.task_tree, mask)
-        try:
-            iter.next()
-        except:
-            # No waiting tasks found.
-            return True
-        return False
+        return self._unfinished_count == 0
+
+    def _unfinished_count_changed(self, task, delta):
+        """
+        Adds the given delta to the number of unfinished tasks of this
+        workflow, and of every workflow that it was merged into.
+        The root of a merged subworkflow is not part of the outer tree,
+        so it is only counted by the subworkflow itself.
+        """
+        workflow = self
+        while workflow is not None:
+            was_completed = workflow._unfinished_count == 0
+            workflow._unfinished_count += delta
+            merged_into = workflow._merged_into
+            if merged_into is not None \
+              and was_completed != (workflow._unfinished_count == 0):
+                merged_into._subworkflow_completed_changed(workflow)
+            if task is not None and task is workflow.task_tree:
+                return
+            workflow = merged_into
+
+    def _task_added_notify(self, task):
+        """
+        Called by a Task of this workflow when it was created.
+        """
+        self._task_map[task.id] = task
+        self._state_index_add(task)
+        self._thread_index_add(task, task.thread_id)
+        if task._state & Task.NOT_FINISHED_MASK != 0:
+            self._unfinished_count_changed(task, 1)
+        if task._state == Task.READY:
+            self._ready_notify(task)
+        if task.task_spec._counts_tokens():
+            self._token_index_update(task)
+
+    def _task_removed_notify(self, task):
+        """
+        Called by a Task of this workflow when it was removed from the tree.
+        """
+        if self._task_map.get(task.id) is task:
+            del self._task_map[task.id]
+            self._state_index_remove(task)
+            self._thread_index_remove(task, task.thread_id)
+            if task._state & Task.NOT_FINISHED_MASK != 0:
+                self._unfinished_count_changed(task, -1)
+            if task in self._token_keys:
+                self._token_index_remove(task)
+            if self._merged_into is not None and self._is_dropped():
+                self._merged_into._subworkflow_dropped_notify(self)
+
+    def _task_state_changed_notify(self, task, old_state):
+        """
+        Called by a Task of this workflow whenever its state was changed.
+        """
+        if self._task_map.get(task.id) is not task:
+            return
+        self._state_index_update(task, old_state)
+        was_unfinished = old_state & Task.NOT_FINISHED_MASK != 0
+        is_unfinished = task._state & Task.NOT_FINISHED_MASK != 0
+        if was_unfinished != is_unfinished:
+            self._unfinished_count_changed(task, is_unfinished and 1 or -1)
+            if task.task_spec._counts_tokens():
+                self._token_index_update(task)
+            for child in task.children:
+                if child.task_spec._counts_tokens():
+                    child.workflow._token_index_update(child)
+        if task._state == Task.READY:
+            self._ready_notify(task)
+        elif task._state == Task.COMPLETED:
+            self._completed_specs.add(task.task_spec)
+
+    def _ready_notify(self, task):
+        """
+        Called whenever a task of this workflow became READY. Tasks of
+        subworkflows are queued by the outer workflow.
+        """
+        queue = self.outer_workflow._ready_queue
+        if queue is None:
+            return
+        queue.append(task)
+
+        # Tasks that were completed or cancelled without going through
+        # the queue are only skipped when popped, so they are purged from
+        # time to time.
+        if len(queue) > 64 \
+          and len(queue) > 2 * self.outer_workflow._count_tasks(Task.READY):
+            seen = set()
+            tasks = []
+            for queued_task in queue:
+                if queued_task in seen \
+                  or not self._is_ready_in_tree(queued_task):
+                    continue
+                seen.add(queued_task)
+                tasks.append(queued_task)
+            queue.clear()
+            queue.extend(tasks)
+
+    def _is_ready_in_tree(self, task):
+        return task._state == Task.READY \
+           and task.workflow._task_map.get(task.id) is task
+
+    def _task_thread_changed_notify(self, task, old_thread_id):
+        """
+        Called by a Task of this workflow whenever its thread id changed.
+        """
+        if self._task_map.get(task.id) is not task:
+            return
+        self._thread_index_remove(task, old_thread_id)
+        self._thread_index_add(task, task.thread_id)
+        if task.task_spec._counts_tokens():
+            self._token_index_update(task)
+
+    def _reset_state_index(self):
+        if self._task_array is None:
+            self._tasks_by_state = dict((state, set())
+                                        for state in Task.state_names)
+        else:
+            self._task_array = TaskArray()
+
+    def _state_index_add(self, task):
+        if self._task_array is None:
+            self._tasks_by_state[task._state].add(task)
+        else:
+            self._task_array.add(task)
+
+    def _state_index_remove(self, task):
+        if self._task_array is None:
+            self._tasks_by_state[task._state].discard(task)
+        else:
+            self._task_array.remove(task)
+
+    def _state_index_update(self, task, old_state):
+        if self._task_array is None:
+            self._tasks_by_state[old_state].discard(task)
+            self._tasks_by_state[task._state].add(task)
+        else:
+            self._task_array.update(task)
+
+    def _thread_index_add(self, task, thread_id):
+        key = thread_id, task.task_spec
+        tasks = self._tasks_by_thread.get(key)
+        if tasks is None:
+            self._tasks_by_thread[key] = set([task])
+        else:
+            tasks.add(task)
+
+    def _thread_index_remove(self, task, thread_id):
+        key = thread_id, task.task_spec
+        tasks = self._tasks_by_thread.get(key)
+        if tasks is None:
+            return
+        tasks.discard(task)
+        if not tasks:
+            del self._tasks_by_thread[key]
+
+    def _token_index_update(self, task):
+        """
+        Records whether the given task holds a token, i.e. whether it is
+        not finished, but the task on the incoming sequence flow (its
+        parent) is. Only used for task specs that count their tokens.
+        """
+        if task in self._token_keys:
+            self._token_index_remove(task)
+        if task._state & Task.NOT_FINISHED_MASK == 0:
+            return
+        parent = task.parent
+        if parent is None or parent._state & Task.NOT_FINISHED_MASK != 0:
+            return
+        if self._task_map.get(task.id) is not task:
+            return
+        key = task.thread_id, task.task_spec
+        tokens = self._tokens.get(key)
+        if tokens is None:
+            tokens = self._tokens[key] = {}
+        tasks = tokens.get(parent.task_spec)
+        if tasks is None:
+            tokens[parent.task_spec] = set([task])
+        else:
+            tasks.add(task)
+        self._token_keys[task] = key, parent.task_spec
+
+    def _token_index_remove(self, task):
+        key, input = self._token_keys.pop(task)
+        tokens = self._tokens[key]
+        tasks = tokens[input]
+        tasks.discard(task)
+        if not tasks:
+            del tokens[input]
+            if not tokens:
+                del self._tokens[key]
+
+    def _get_tokens(self, thread_id, task_spec):
+        """
+        Returns the tokens that arrived at the given task spec in the given
+        thread, as a dictionary that maps each incoming task spec to the
+        set of tasks that hold a token from it. Only tasks of this
+        workflow are included, and only for task specs that count their
+        tokens (see L{SpiffWorkflow.specs.TaskSpec._counts_tokens()}).
+        The result must not be modified.
+
+        :type  thread_id: integer
+        :param thread_id: The id of the thread.
+        :type  task_spec: TaskSpec
+        :param task_spec: The task spec that receives the tokens.
+        :rtype:  dict(TaskSpec, set(Task))
+        :returns: The tasks that hold a token, by incoming task spec.
+        """
+        return self._tokens.get((thread_id, task_spec), {})
+
+    def _subworkflow_merged_notify(self, subworkflow):
+        """
+        Called when the task tree of the given subworkflow was integrated
+        into the task tree of this workflow.
+        """
+        if subworkflow.is_completed():
+            self._finished_subworkflows.append(subworkflow)
+        else:
+            self._subworkflows.append(subworkflow)
+        subworkflow._merged_into = self
+        delta = subworkflow._unfinished_count
+        root = subworkflow.task_tree
+        if not root._is_finished() \
+          and subworkflow._task_map.get(root.id) is root:
+            delta -= 1
+        self._unfinished_count_changed(None, delta)
+
+    def _subworkflow_completed_changed(self, subworkflow):
+        """
+        Called when a merged subworkflow was completed, or has unfinished
+        tasks again. Lookups for unfinished tasks only search the
+        subworkflows that are not completed.
+        """
+        if subworkflow.is_completed():
+            self._subworkflows.remove(subworkflow)
+            self._finished_subworkflows.append(subworkflow)
+        else:
+            self._finished_subworkflows.remove(subworkflow)
+            self._subworkflows.append(subworkflow)
+
+    def _subworkflow_dropped_notify(self, subworkflow):
+        """
+        Called when all tasks of a merged subworkflow were removed from
+        the tree, e.g. by Task._drop_children() or by compact().
+        """
+        if subworkflow in self._subworkflows:
+            self._subworkflows.remove(subworkflow)
+        else:
+            self._finished_subworkflows.remove(subworkflow)
+        subworkflow._merged_into = None
+        if self._merged_into is not None and self._is_dropped():
+            self._merged_into._subworkflow_dropped_notify(self)
+
+    def _is_dropped(self):
+        """
+        Returns True if none of the tasks of this merged subworkflow are
+        left in the tree. Its root is not part of the outer tree.
+        """
+        if self._subworkflows or self._finished_subworkflows:
+            return False
+        n_tasks = len(self._task_map)
+        if self._task_map.get(self.task_tree.id) is self.task_tree:
+            n_tasks -= 1
+        return n_tasks == 0
+
+    def _get_subworkflows(self, state=Task.ANY_MASK):
+        """
+        Returns the merged subworkflows that may contain tasks in the
+        given state.
+        """
+        if state & Task.FINISHED_MASK == 0:
+            return self._subworkflows
+        return self._subworkflows + self._finished_subworkflows
+
+    def __setstate__(self, state):
+        self._completed_specs = set()
+        self._task_array = None
+        self.__dict__.update(state)
+        if '_task_map' in state:
+            return
+
+        # A pickle that was made before the lookup tables were added. Such
+        # a workflow kept the full history, and predicted all tasks.
+        self.history = Task.HISTORY_LOG
+        self.prediction = Task.PREDICT_ALL
+        self._task_map = {}
+        self._tasks_by_state = dict((s, set()) for s in Task.state_names)
+        self._tasks_by_thread = {}
+        self._tokens = {}
+        self._token_keys = {}
+        self._subworkflows = []
+        self._finished_subworkflows = []
+        self._merged_into = None
+        self._unfinished_count = 0
+        self._ready_queue = None
+        if self.outer_workflow is not self:
+            return
+
+        # The outer workflow is unpickled last, so its tree is complete
+        # now, including the trees of merged subworkflows. Recompute the
+        # ancestry and the subtree masks of all tasks, then the lookup
+        # tables of each workflow.
+        tasks = list(Task.Iterator(self.task_tree))
+        for task in tasks:
+            task._link_ancestry()
+        for task in reversed(tasks):
+            task._subtree_mask = task._state
+            task._recount_children()
+        merged = []
+        for task in tasks:
+            if task.parent is not None \
+              and task.workflow is not task.parent.workflow \
+              and task.workflow not in [w for p, w in merged]:
+                merged.append((task.parent.workflow, task.workflow))
+        self._rebuild_task_map()
+        for parent, subworkflow in merged:
+            subworkflow._rebuild_task_map()
+        # Inner merges first, so that each count includes the subworkflows
+        # of the merged subworkflow.
+        for parent, subworkflow in reversed(merged):
+            parent._subworkflow_merged_notify(subworkflow)
+
+    def _rebuild_task_map(self):
+        """
+        Re-creates the lookup tables from the current task tree. Must be
+        called whenever the tree was replaced without going through the
+        Task API, e.g. by a serializer.
+        """
+        self._task_map = {}
+        self._reset_state_index()
+        self._tasks_by_thread = {}
+        self._tokens = {}
+        self._token_keys = {}
+        if self._ready_queue is not None:
+            self._ready_queue.clear()
+        for task in self.task_tree:
+            if task.workflow is not self:
+                continue
+            self._task_map[task.id] = task
+            self._state_index_add(task)
+            self._thread_index_add(task, task.thread_id)
+            if task._state == Task.READY:
+                self._ready_notify(task)
+            if task.id > self.task_id_assigner.id_pool:
+                self.task_id_assigner.id_pool = task.id
+        for task in self._task_map.itervalues():
+            if task.task_spec._counts_tokens():
+                self._token_index_update(task)
+        unfinished_count = self._count_tasks(Task.NOT_FINISHED_MASK)
+        self._unfinished_count_changed(None,
+                                       unfinished_count - self._unfinished_count)
+
+    def _find_tasks(self, state):
+        """
+        Returns the set of all tasks in the tree that have the given state,
+        including those of merged subworkflows. The result is unordered.
+        """
+        if self._task_array is None:
+            tasks = set()
+            for task_state, bucket in self._tasks_by_state.iteritems():
+                if task_state & state != 0:
+                    tasks.update(bucket)
+        else:
+            tasks = self._task_array.find(state)
+        for subworkflow in self._get_subworkflows(state):
+            subtasks = subworkflow._find_tasks(state)
+            subtasks.discard(subworkflow.task_tree)
+            tasks.update(subtasks)
+        return tasks
+
+    def _count_tasks(self, state):
+        """
+        Like _find_tasks(), but only returns the number of tasks.
+        """
+        if self._task_array is None:
+            count = 0
+            for task_state, bucket in self._tasks_by_state.iteritems():
+                if task_state & state != 0:
+                    count += len(bucket)
+        else:
+            count = self._task_array.count(state)
+        for subworkflow in self._get_subworkflows(state):
+            count += subworkflow._count_tasks(state)
+            root = subworkflow.task_tree
+            if root._state & state != 0 \
+              and subworkflow._task_map.get(root.id) is root:
+                count -= 1
+        return count
+
+    def _find_thread_tasks(self, thread_id, task_spec):
+        """
+        Like _find_tasks(), but returns the tasks that have the given
+        thread id and task spec.
+        """
+        tasks = set(self._tasks_by_thread.get((thread_id, task_spec), ()))
+        for subworkflow in self._get_subworkflows():
+            subtasks = subworkflow._find_thread_tasks(thread_id, task_spec)
+            subtasks.discard(subworkflow.task_tree)
+            tasks.update(subtasks)
+        return tasks
+
+    def _get_thread_tasks(self, thread_id, task_spec):
+        """
+        Returns all tasks in the tree that have the given thread id and
+        task spec, in the order in which Task.Iterator would visit them.
+
+        :type  thread_id: integer
+        :param thread_id: The id of the thread.
+        :type  task_spec: TaskSpec
+        :param task_spec: The wanted task spec.
+        :rtype:  list[Task]
+        :returns: A list of tasks.
+        """
+        return self._sort_tasks(self._find_thread_tasks(thread_id, task_spec))
+
+    def _sort_tasks(self, tasks):
+        """
+        Returns the given tasks in the order in which Task.Iterator would
+        visit them. Two tasks are ordered by their ancestors right below
+        the closest common ancestor, which is found through the jump
+        pointers in O(log(depth)); the positions of these ancestors among
+        their siblings decide.
+        """
+        positions = {}
+
+        def get_position(task):
+            parent = task.parent
+            siblings = positions.get(parent)
+            if siblings is None:
+                siblings = dict((c, n) for n, c in enumerate(parent.children))
+                positions[parent] = siblings
+            return siblings[task]
+
+        def compare(task1, task2):
+            depth = min(task1._depth, task2._depth)
+            ancestor1 = task1._get_ancestor_at_depth(depth)
+            ancestor2 = task2._get_ancestor_at_depth(depth)
+            # An ancestor is visited before its descendants.
+            if ancestor1 is ancestor2:
+                return cmp(task1._depth, task2._depth)
+            while ancestor1.parent is not ancestor2.parent:
+                if ancestor1._jump is not ancestor2._jump:
+                    ancestor1 = ancestor1._jump
+                    ancestor2 = ancestor2._jump
+                else:
+                    ancestor1 = ancestor1.parent
+                    ancestor2 = ancestor2.parent
+            # Tasks that are not in our tree come last.
+            if ancestor1.parent is None:
+                return cmp(ancestor2 is self.task_tree,
+                           ancestor1 is self.task_tree)
+            return cmp(get_position(ancestor1), get_position(ancestor2))
+
+        return sorted(tasks, cmp = compare)
 
     def _get_waiting_tasks(self):
-        waiting = Task.Iterator(self.task_tree, Task.WAITING)
-        return [w for w in waiting]
+        return self.get_tasks(Task.WAITING)
+
+    def _pop_completed_specs(self):
+        """
+        Returns the task specs of all tasks that were COMPLETED in this
+        workflow or its merged subworkflows since the last call, and
+        starts collecting anew.
+
+        :rtype:  set(TaskSpec)
+        :returns: The task specs of the completed tasks.
+        """
+        completed_specs = self._completed_specs
+        self._completed_specs = set()
+        for subworkflow in self._get_subworkflows(Task.WAITING):
+            completed_specs |= subworkflow._pop_completed_specs()
+        return completed_specs
+
+    def _wake_waiting_tasks(self):
+        """
+        Updates the state of every WAITING task that may depend on a task
+        that was COMPLETED since the last call. This includes tasks that
+        were COMPLETED without Task.complete(), e.g. the inputs that a
+        Join completes when it fires.
+        """
+        completed_specs = self._pop_completed_specs()
+        for task in self._get_waiting_tasks():
+            task_specs = task.task_spec._wakeup_task_specs()
+            if task_specs is None:
+                task.task_spec._update_state(task)
+                continue
+            # Tasks that are completed by this loop are seen by the
+            # tasks that come later, and again by the next call.
+            later_specs = task.workflow._completed_specs
+            for task_spec in task_specs:
+                if task_spec in completed_specs or task_spec in later_specs:
+                    task.task_spec._update_state(task)
+                    break
 
     def _task_completed_notify(self, task):
         if task.get_name() == 'End':
-            self.attributes.update(task.get_attributes())
-        # Update the state of every WAITING task.
-        for thetask in self._get_waiting_tasks():
-            thetask.task_spec._update_state(thetask)
-        if self.completed_event.n_subscribers() == 0:
-            # Since is_completed() is expensive it makes sense to bail
-            # out if calling it is not necessary.
-            return
+            self.attributes.update(task._peek_attributes())
+        # Update the state of every WAITING task that depends on it.
+        self._wake_waiting_tasks()
         if self.is_completed():
             self.completed_event(self)
 
@@ -137,12 +713,8 @@ class Workflow(object):
                         completed.
         """
         self.success = success
-        cancel = []
         mask = Task.NOT_FINISHED_MASK
-        for task in Task.Iterator(self.task_tree, mask):
-            cancel.append(task)
-        for task in cancel:
-            task.cancel()
+        Task._cancel_tasks([t for t in Task.Iterator(self.task_tree, mask)])
 
     def get_task_spec_from_name(self, name):
         """
@@ -155,6 +727,35 @@ class Workflow(object):
         """
         return self.spec.get_task_spec_from_name(name)
 
+    def predict(self):
+        """
+        Adds the predicted (MAYBE and LIKELY) tasks for all possible
+        routes, like Task.PREDICT_ALL does. Meant for rendering a forecast
+        of a workflow that uses Task.PREDICT_DEFINITE. The added tasks are
+        removed as usual once the workflow decides against them.
+        """
+        workflows = self._get_workflows()
+        predictions = [workflow.prediction for workflow in workflows]
+        for workflow in workflows:
+            workflow.prediction = Task.PREDICT_ALL
+        try:
+            for task in self.get_tasks(Task.FUTURE | Task.WAITING | Task.READY):
+                if task.parent is None or task.parent._is_finished():
+                    task.task_spec._predict(task)
+        finally:
+            for workflow, prediction in zip(workflows, predictions):
+                workflow.prediction = prediction
+
+    def _get_workflows(self):
+        """
+        Returns this workflow and all subworkflows that were merged into
+        it, recursively.
+        """
+        workflows = [self]
+        for subworkflow in self._get_subworkflows():
+            workflows.extend(subworkflow._get_workflows())
+        return workflows
+
     def get_task(self, id):
         """
         Returns the task with the given id.
@@ -164,8 +765,14 @@ class Workflow(object):
         :rtype: Task
         :returns: The task with the given id.
         """
-        tasks = [task for task in self.get_tasks() if task.id == id]
-        return tasks[0] if len(tasks) == 1 else None
+        task = self._task_map.get(id)
+        if task is not None:
+            return task
+        for subworkflow in self._get_subworkflows():
+            task = subworkflow.get_task(id)
+            if task is not None and task is not subworkflow.task_tree:
+                return task
+        return None
 
     def get_tasks(self, state=Task.ANY_MASK):
         """
@@ -176,7 +783,25 @@ class Workflow(object):
         :rtype:  list[Task]
         :returns: A list of tasks.
         """
-        return [t for t in Task.Iterator(self.task_tree, state)]
+        # Task.Iterator does not descend into LIKELY tasks unless LIKELY
+        # tasks are searched, which hides their MAYBE children.
+        if state & Task.PREDICTED_MASK != 0 and state & Task.LIKELY == 0:
+            return [t for t in Task.Iterator(self.task_tree, state)]
+        return self._sort_tasks(self._find_tasks(state))
+
+    def get_task_count(self, state=Task.ANY_MASK):
+        """
+        Returns the number of tasks with the given state. This is the
+        same as len(get_tasks(state)), but without building the list.
+
+        :type  state: integer
+        :param state: A bitmask of states.
+        :rtype:  integer
+        :returns: The number of tasks.
+        """
+        if state & Task.PREDICTED_MASK != 0 and state & Task.LIKELY == 0:
+            return len(self.get_tasks(state))
+        return self._count_tasks(state)
 
     def complete_task_from_id(self, task_id):
         """
@@ -187,9 +812,9 @@ class Workflow(object):
         """
         if task_id is None:
             raise WorkflowException(self.spec, 'task_id is None')
-        for task in self.task_tree:
-            if task.id == task_id:
-                return task.complete()
+        task = self.get_task(task_id)
+        if task is not None:
+            return task.complete()
         msg = 'A task with the given task_id (%s) was not found' % task_id
         raise WorkflowException(self.spec, msg)
 
@@ -222,14 +847,17 @@ class Workflow(object):
                 blacklist.append(next)
 
         # Walk through all ready tasks.
-        for task in Task.Iterator(self.task_tree, Task.READY):
-            for blacklisted_task in blacklist:
-                if task._is_descendant_of(blacklisted_task):
-                    continue
-            if task.complete():
-                self.last_task = task
+        if self._ready_queue is not None:
+            if self._complete_next_from_queue(blacklist):
                 return True
-            blacklist.append(task)
+        else:
+            for task in Task.Iterator(self.task_tree, Task.READY):
+                if self._is_blacklisted(task, blacklist):
+                    continue
+                if task.complete():
+                    self.last_task = task
+                    return True
+                blacklist.append(task)
 
         # Walk through all waiting tasks.
         for task in Task.Iterator(self.task_tree, Task.WAITING):
@@ -239,6 +867,38 @@ class Workflow(object):
                 return True
         return False
 
+    def _is_blacklisted(self, task, blacklist):
+        for blacklisted_task in blacklist:
+            if task is blacklisted_task \
+              or task._is_descendant_of(blacklisted_task):
+                return True
+        return False
+
+    def _complete_next_from_queue(self, blacklist):
+        """
+        Like the search for READY tasks in complete_next(), but takes the
+        tasks from the ready queue. Tasks that could not be completed are
+        put back in front of the queue.
+        """
+        queue = self._ready_queue
+        skipped = []
+        try:
+            while queue:
+                task = queue.popleft()
+                if not self._is_ready_in_tree(task) or task in skipped:
+                    continue
+                if self._is_blacklisted(task, blacklist):
+                    skipped.append(task)
+                    continue
+                if task.complete():
+                    self.last_task = task
+                    return True
+                blacklist.append(task)
+                skipped.append(task)
+            return False
+        finally:
+            queue.extendleft(reversed(skipped))
+
     def complete_all(self, pick_up=True):
         """
         Runs all branches until completion. This is a convenience wrapper
@@ -250,6 +910,108 @@ class Workflow(object):
         while self.complete_next(pick_up):
             pass
 
+    def complete_steps(self, max_steps=None, timeout=None, pick_up=True):
+        """
+        Like complete_all(), but returns after the given number of tasks
+        was completed, or after the given number of seconds, whichever
+        comes first. Since complete_next() picks up where the last call
+        left off, the workflow may be resumed by calling this method
+        again, which allows for interleaving many workflows.
+
+        :type  max_steps: integer
+        :param max_steps: The maximum number of tasks to complete, or None.
+        :type  timeout: float
+        :param timeout: The maximum number of seconds, or None. At least
+                        one task is completed regardless of the timeout.
+        :type  pick_up: boolean
+        :param pick_up: Passed on to each call of complete_next().
+        :rtype:  boolean
+        :returns: True if the budget was used up, False if no more tasks
+                  could be completed.
+        """
+        budget = StepBudget(max_steps, timeout)
+        while not budget.is_exhausted():
+            if not self.complete_next(pick_up):
+                return False
+            budget.steps += 1
+        return True
+
+    def compact(self, sink=None):
+        """
+        Removes finished branches from the task tree, such that the tree
+        of a long running workflow stays bounded. A branch is removed if
+        it, as well as its parent, is COMPLETED or CANCELLED, and if
+        none of its tasks may still be looked up by another task, e.g.
+        by a Join or a Trigger. The subtree of a split whose branches are
+        counted by a structured Join is only removed once all of its
+        tasks are finished. The parent of each removed branch counts
+        the number of removed tasks in its 'archived' internal attribute.
+
+        :type  sink: callable
+        :param sink: Called with the top task of each removed branch,
+                     e.g. to store the history elsewhere.
+        :rtype:  integer
+        :returns: The number of tasks that were removed.
+        """
+        referenced = set()
+        splits = set()
+        wf_specs = set(w.spec for w in self._get_workflows())
+        for wf_spec in wf_specs:
+            for task_spec in wf_spec.task_specs.itervalues():
+                referenced.update(task_spec._referenced_task_specs())
+                splits.update(task_spec._split_task_specs())
+
+        # Branches that still contain unfinished tasks are searched for
+        # finished sub-branches. Finished branches are visited in
+        # post-order, so that each task is only looked at once.
+        archived = 0
+        stack = [(self.task_tree, False)]
+        clean = {}
+        while stack:
+            task, visited = stack.pop()
+            if not visited:
+                stack.append((task, True))
+                # The branches of a split are kept whole until all of
+                # them are finished, because a structured Join counts
+                # them.
+                if task.task_spec in splits \
+                  and task._subtree_mask & Task.NOT_FINISHED_MASK:
+                    continue
+                for child in task.children:
+                    stack.append((child, False))
+                continue
+
+            # A task can be archived with its descendants if neither of
+            # them is unfinished or referenced. Merged subworkflows whose
+            # tasks were all archived are no longer searched.
+            children = task.children[:]
+            clean_children = [clean.pop(c, False) for c in children]
+            if task._subtree_mask & Task.NOT_FINISHED_MASK == 0 \
+              and task.task_spec not in referenced \
+              and False not in clean_children \
+              and task.parent is not None:
+                clean[task] = True
+                continue
+
+            # Archive all clean children of a task that is itself finished.
+            if not task._is_finished():
+                continue
+            for child, is_clean in zip(children, clean_children):
+                if not is_clean:
+                    continue
+                n_tasks = len([t for t in Task.Iterator(child)])
+                task._remove_child(child)
+                count = task._get_internal_attribute('archived', 0)
+                task._set_internal_attribute(archived = count + n_tasks)
+                archived += n_tasks
+                if self.last_task is not None \
+                  and (self.last_task is child
+                       or self.last_task._is_descendant_of(child)):
+                    self.last_task = None
+                if sink is not None:
+                    sink(child)
+        return archived
+
     def get_dump(self):
         """
         Returns a complete dump of the current internal task tree for
@@ -0,0 +1,216 @@
+# Copyright (C) 2007 Samuel Abels
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+from Queue import Queue, Empty
+from Task import Task
+
+LOG = logging.getLogger(__name__)
+
+
+class WorkflowRunner(object):
+    """
+    Drives any number of workflows from a single thread.
+
+    READY tasks are completed right away. For WAITING tasks that wait
+    for a point in time, such as timers, the runner asks the task spec
+    for the time (see L{SpiffWorkflow.specs.TaskSpec._get_wake_time()})
+    and keeps it in a heap; run() sleeps until the earliest of them.
+    For other WAITING tasks, the runner asks the task spec for a wait
+    handle (see L{SpiffWorkflow.specs.TaskSpec._get_wait_handle()}),
+    e.g. for the exit of an external process, and calls it in a
+    background thread. The task is updated as soon as its time came or
+    its handle returned, so WAITING tasks are never polled, and the
+    runner is idle while nothing happens. All changes to the workflows
+    are made by the thread that called run().
+
+    Usage::
+
+        runner = WorkflowRunner()
+        runner.add(Workflow(wf_spec))
+        runner.add(Workflow(wf_spec))
+        runner.run()
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.workflows = []
+        self._pending = set()
+        self._events = Queue()
+        self._timers = []
+        self._timer_ids = itertools.count()
+        self._dirty = []
+
+    def add(self, workflow):
+        """
+        Adds the given workflow to the runner. It is advanced by the
+        next call of run().
+
+        :type  workflow: Workflow
+        :param workflow: The workflow.
+        """
+        self.workflows.append(workflow)
+        self._dirty.append(workflow)
+
+    def remove(self, workflow):
+        """
+        Removes the given workflow from the runner. Wait handles that are
+        still running for its tasks are ignored when they return, and its
+        timers are dropped.
+
+        :type  workflow: Workflow
+        :param workflow: The workflow.
+        """
+        self.workflows.remove(workflow)
+        if workflow in self._dirty:
+            self._dirty.remove(workflow)
+        timers = []
+        for timer in self._timers:
+            wake_time, timer_id, timer_workflow, task = timer
+            if timer_workflow is workflow:
+                self._pending.discard(task)
+            else:
+                timers.append(timer)
+        heapq.heapify(timers)
+        self._timers = timers
+
+    def wake(self, workflow):
+        """
+        Lets the next call of run() advance the given workflow, e.g.
+        after a task was completed or a message was delivered from
+        outside of the runner.
+
+        :type  workflow: Workflow
+        :param workflow: The workflow.
+        """
+        if workflow not in self._dirty:
+            self._dirty.append(workflow)
+
+    def run(self, timeout=None):
+        """
+        Advances all workflows until each of them is either completed, or
+        only has tasks left that can not proceed without outside help,
+        such as user tasks.
+
+        :type  timeout: float
+        :param timeout: The maximum number of seconds to wait for timers
+                        and wait handles, or None.
+        :rtype:  boolean
+        :returns: True if all workflows are completed, False otherwise.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            self._fire_timers()
+            while self._dirty:
+                self._advance(self._dirty.pop(0))
+            if not self._pending:
+                break
+
+            # Sleep until a wait handle returns, or the next timer is due.
+            now = time.time()
+            if timeout is None:
+                # Queue.get() without a timeout can not be interrupted.
+                wait = 3600
+            else:
+                wait = deadline - now
+                if wait <= 0:
+                    break
+            if self._timers:
+                wait = max(min(wait, self._timers[0][0] - now), 0)
+            try:
+                workflow, task, exc_info = self._events.get(True, wait)
+            except Empty:
+                continue
+            self._pending.discard(task)
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if workflow not in self.workflows:
+                continue
+            if task._has_state(Task.WAITING):
+                task.task_spec._update_state(task)
+            self.wake(workflow)
+
+        for workflow in self.workflows:
+            if not workflow.is_completed():
+                return False
+        return True
+
+    def _advance(self, workflow):
+        """
+        Completes the READY tasks of the given workflow, and schedules the
+        timers or starts the wait handles of its WAITING tasks.
+        """
+        self._complete_ready_tasks(workflow)
+        for task in workflow.get_tasks(Task.WAITING):
+            if task in self._pending:
+                continue
+            wake_time = task.task_spec._get_wake_time(task)
+            if wake_time is not None:
+                self._pending.add(task)
+                timer = wake_time, self._timer_ids.next(), workflow, task
+                heapq.heappush(self._timers, timer)
+                continue
+            handle = task.task_spec._get_wait_handle(task)
+            if handle is None:
+                continue
+            self._pending.add(task)
+            thread = threading.Thread(target=self._wait,
+                                      args=(workflow, task, handle))
+            thread.daemon = True
+            thread.start()
+
+    def _fire_timers(self):
+        """
+        Updates the tasks whose timers are due.
+        """
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            wake_time, timer_id, workflow, task = heapq.heappop(self._timers)
+            self._pending.discard(task)
+            if task._has_state(Task.WAITING):
+                task.task_spec._update_state(task)
+            self.wake(workflow)
+
+    def _complete_ready_tasks(self, workflow):
+        """
+        Completes READY tasks of the given workflow until none are left.
+        May be overwritten to leave some tasks for the user.
+        """
+        tasks = workflow.get_tasks(Task.READY)
+        while tasks:
+            for task in tasks:
+                if task._has_state(Task.READY):
+                    task.complete()
+            tasks = workflow.get_tasks(Task.READY)
+
+    def _wait(self, workflow, task, handle):
+        """
+        Runs in a background thread.
+        """
+        try:
+            handle()
+        except Exception:
+            LOG.exception('Wait handle of %s failed' % task.get_name())
+            self._events.put((workflow, task, sys.exc_info()))
+            return
+        self._events.put((workflow, task, None))
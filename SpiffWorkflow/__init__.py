@@ -1,5 +1,6 @@
 from SpiffWorkflow.version import __version__
 from SpiffWorkflow.Workflow import Workflow
+from SpiffWorkflow.WorkflowRunner import WorkflowRunner
 from SpiffWorkflow.Task import Task
 from SpiffWorkflow.exceptions import WorkflowException
 
@@ -15,8 +15,11 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
 from SpiffWorkflow.Task import Task
-from SpiffWorkflow.Workflow import Workflow
+from SpiffWorkflow.Workflow import Workflow, StepBudget
+from SpiffWorkflow.specs.TaskSpec import TaskSpec
 from SpiffWorkflow.bpmn.BpmnScriptEngine import BpmnScriptEngine
+from SpiffWorkflow.bpmn.specs.ParallelGateway import ParallelGateway
+from SpiffWorkflow.bpmn.specs.InclusiveGateway import InclusiveGateway
 
 class BpmnWorkflow(Workflow):
     """
@@ -49,21 +52,80 @@ class BpmnWorkflow(Workflow):
         assert not self.read_only
         self.refresh_waiting_tasks()
         self.do_engine_steps()
-        for my_task in Task.Iterator(self.task_tree, Task.WAITING):
+        for my_task in self.get_tasks(Task.WAITING):
             my_task.task_spec.accept_message(my_task, message)
 
-    def do_engine_steps(self):
+    def do_engine_steps(self, max_steps=None, timeout=None, pool=None):
         """
         Execute any READY tasks that are engine specific (for example, gateways or script tasks).
         This is done in a loop, so it will keep completing those tasks until there are only
         READY User tasks, or WAITING tasks left.
+
+        :param max_steps: if set, return after completing this many tasks.
+
+        :param timeout: if set, return after (roughly) this many seconds. At least one task is
+        completed regardless of the timeout, and so are the tasks that were already prepared
+        in the pool.
+
+        :param pool: if set, a thread pool (e.g. a multiprocessing.pool.ThreadPool) that is used to
+        run the expensive part of the READY tasks in parallel, such as scripts (see
+        TaskSpec._prepare_hook()). The tasks are still completed one by one, in the same order
+        as without a pool. The workflow is not locked: the pool threads only run the prepare
+        hooks, which look at nothing but their own task, while this method waits for them.
+        Every other change to the workflow is made by the calling thread, so the workflow
+        must not be used by any other thread during the call. Only tasks that the step budget
+        allows to complete are prepared. If a task fails, the tasks that were prepared after
+        it stay READY; they are completed without being prepared again, unless the workflow
+        is saved and restored first.
+
+        Returns True if the budget was used up while engine tasks were still READY, in which
+        case the caller may resume by calling this method again. Returns False otherwise.
         """
         assert not self.read_only
+        budget = StepBudget(max_steps, timeout)
         engine_steps = filter(lambda t: self._is_engine_task(t.task_spec), self.get_tasks(Task.READY))
         while engine_steps:
-            for task in engine_steps:
+            prepared_end = 0
+            for i, task in enumerate(engine_steps):
+                # The tasks that were prepared in this call are completed
+                # even if the time is up, so that none is left prepared.
+                if i >= prepared_end and budget.is_exhausted():
+                    return True
+                # A task that was completed earlier in the batch may have
+                # cancelled this one (e.g. a terminating end event).
+                if not task._has_state(Task.READY):
+                    continue
+                if pool is not None and not task._prepared:
+                    prepared_end = i + self._prepare_tasks(pool, engine_steps[i:], budget)
                 task.complete()
+                budget.steps += 1
             engine_steps = filter(lambda t: self._is_engine_task(t.task_spec), self.get_tasks(Task.READY))
+        return False
+
+    def _prepare_tasks(self, pool, tasks, budget):
+        # Only the branches that a gateway started together are prepared
+        # in parallel. They are the siblings that directly follow the
+        # first task in the batch, and must each have work to prepare:
+        # such a task cannot cancel the others when it is completed.
+        # Returns the number of tasks that were prepared.
+        parent = tasks[0].parent
+        if parent is None or not isinstance(parent.task_spec, (ParallelGateway, InclusiveGateway)):
+            return 0
+        if budget.max_steps is not None:
+            tasks = tasks[:budget.max_steps - budget.steps]
+        siblings = []
+        for task in tasks:
+            if task.parent is not parent \
+              or not task._has_state(Task.READY) \
+              or not self._has_prepare_hook(task.task_spec):
+                break
+            siblings.append(task)
+        # Errors are stored in each task by TaskSpec._prepare(), and raised
+        # when that task is completed.
+        if len(siblings) < 2:
+            return 0
+        pool.map(lambda t: t.task_spec._prepare(t), siblings)
+        return len(siblings)
 
     def refresh_waiting_tasks(self):
         """
@@ -94,6 +156,9 @@ class BpmnWorkflow(Workflow):
     def _is_engine_task(self, task_spec):
         return not hasattr(task_spec, 'is_engine_task') or task_spec.is_engine_task()
 
+    def _has_prepare_hook(self, task_spec):
+        return type(task_spec)._prepare_hook.im_func is not TaskSpec._prepare_hook.im_func
+
     def _task_completed_notify(self, task):
         assert (not self.read_only) or self._is_busy_with_restore()
         super(BpmnWorkflow, self)._task_completed_notify(task)
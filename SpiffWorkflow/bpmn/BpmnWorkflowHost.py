@@ -0,0 +1,275 @@
+# Copyright (C) 2012 Matthew Hampton
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+import multiprocessing
+import pickle
+import threading
+import traceback
+import zlib
+from SpiffWorkflow.bpmn.BpmnWorkflow import BpmnWorkflow
+from SpiffWorkflow.bpmn.storage.CompactWorkflowSerializer import CompactWorkflowSerializer
+
+class RemoteWorkflowException(Exception):
+    """
+    Raised by the BpmnWorkflowHost when an operation failed in a worker process. The message
+    contains the traceback from the worker.
+    """
+    pass
+
+class _Worker(object):
+    """
+    Owns the workflow instances of one shard. Runs in a worker process.
+    """
+
+    def __init__(self, specs, serializer):
+        self.specs = specs
+        self.serializer = serializer
+        self.workflows = {}
+        self.spec_names = {}
+
+    def start_workflow(self, instance_id, spec_name):
+        if instance_id in self.workflows:
+            raise KeyError('Workflow instance %r exists' % instance_id)
+        self.workflows[instance_id] = BpmnWorkflow(self.specs[spec_name])
+        self.spec_names[instance_id] = spec_name
+        return self._advance(instance_id)
+
+    def complete_task(self, instance_id, task_name, attributes):
+        workflow = self.workflows[instance_id]
+        for task in workflow.get_ready_user_tasks():
+            if task_name in (task.task_spec.name, task.task_spec.description):
+                break
+        else:
+            raise KeyError('No READY user task %r in %r' % (task_name, instance_id))
+        if attributes:
+            task.set_attribute(**attributes)
+        task.complete()
+        return self._advance(instance_id)
+
+    def accept_message(self, instance_id, message):
+        self.workflows[instance_id].accept_message(message)
+        return self._advance(instance_id)
+
+    def refresh_waiting_tasks(self, instance_id=None):
+        if instance_id is not None:
+            self.workflows[instance_id].refresh_waiting_tasks()
+            return self._advance(instance_id)
+        for instance_id, workflow in self.workflows.iteritems():
+            workflow.refresh_waiting_tasks()
+            self._advance(instance_id)
+        return None
+
+    def get_status(self, instance_id):
+        workflow = self.workflows[instance_id]
+        return dict(completed=workflow.is_completed(),
+                    ready_user_tasks=[t.get_description() for t in workflow.get_ready_user_tasks()],
+                    waiting_tasks=[t.get_description() for t in workflow.get_waiting_tasks()])
+
+    def save_workflow(self, instance_id):
+        workflow = self.workflows[instance_id]
+        return self.spec_names[instance_id], self.serializer.serialize_workflow(workflow)
+
+    def load_workflow(self, instance_id, spec_name, state):
+        if instance_id in self.workflows:
+            raise KeyError('Workflow instance %r exists' % instance_id)
+        self.workflows[instance_id] = self.serializer.deserialize_workflow(
+            state, workflow_spec=self.specs[spec_name])
+        self.spec_names[instance_id] = spec_name
+        return self._advance(instance_id)
+
+    def remove_workflow(self, instance_id):
+        del self.workflows[instance_id]
+        del self.spec_names[instance_id]
+
+    def get_instance_ids(self):
+        return self.workflows.keys()
+
+    def _advance(self, instance_id):
+        self.workflows[instance_id].do_engine_steps()
+        return self.get_status(instance_id)
+
+def _run_worker(conn, specs, serializer):
+    """
+    The main loop of a worker process.
+    """
+    worker = _Worker(specs, serializer)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        operation, args = request
+        try:
+            result = getattr(worker, operation)(*args)
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+        else:
+            conn.send((True, result))
+    conn.close()
+
+class BpmnWorkflowHost(object):
+    """
+    Hosts BpmnWorkflow instances in a pool of worker processes, to make use of more than one
+    core. Each instance is owned by one worker, chosen by its instance id, and all operations on
+    the instance are routed to that worker. A copy of the specs is frozen (see
+    WorkflowSpec.freeze()) when the workers are started, and each worker holds its own copy of
+    them, which is shared by all of its instances. The given specs are not changed.
+
+    Every operation completes the engine tasks of the instance before it returns the status of
+    the instance, a dictionary with the 'completed' flag and the descriptions of the
+    'ready_user_tasks' and 'waiting_tasks'.
+
+    Instances are handed off between hosts (or stored in a database) through save_workflow() and
+    load_workflow(), which use the given serializer. The CompactWorkflowSerializer does not
+    include the task attributes; see its documentation.
+
+    Usage::
+
+        host = BpmnWorkflowHost({'Approvals': spec}, processes=4)
+        host.start()
+        host.start_workflow('order-1', 'Approvals')
+        host.complete_task('order-1', 'Approve')
+        host.close()
+    """
+
+    def __init__(self, specs, processes=None, serializer=None):
+        """
+        Constructor.
+
+        :param specs: a dictionary mapping names to the BpmnProcessSpec instances that may be
+        started.
+
+        :param processes: the number of worker processes. Defaults to the number of CPUs.
+
+        :param serializer: the serializer used by save_workflow() and load_workflow(). Defaults
+        to a CompactWorkflowSerializer.
+        """
+        self.specs = specs
+        self.processes = processes or multiprocessing.cpu_count()
+        self.serializer = serializer or CompactWorkflowSerializer()
+        self._workers = []
+
+    def start(self):
+        """
+        Starts the worker processes.
+        """
+        assert not self._workers
+        # Freeze a copy, so that the caller's specs may still be changed.
+        specs = pickle.loads(pickle.dumps(self.specs, pickle.HIGHEST_PROTOCOL))
+        for spec in specs.itervalues():
+            spec.freeze()
+        for i in range(self.processes):
+            conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_run_worker,
+                                              args=(child_conn, specs, self.serializer))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._workers.append((process, conn, threading.Lock()))
+
+    def close(self):
+        """
+        Stops the worker processes. All instances that were not saved are lost.
+        """
+        for process, conn, lock in self._workers:
+            with lock:
+                conn.send(None)
+                conn.close()
+        for process, conn, lock in self._workers:
+            process.join()
+        self._workers = []
+
+    def get_shard(self, instance_id):
+        """
+        Returns the index of the worker process that owns the given instance. The result only
+        depends on the instance id and the number of processes.
+        """
+        return (zlib.crc32(str(instance_id)) & 0xffffffff) % self.processes
+
+    def start_workflow(self, instance_id, spec_name):
+        """
+        Starts a new instance of the spec with the given name.
+        """
+        return self._call(instance_id, 'start_workflow', spec_name)
+
+    def complete_task(self, instance_id, task_name, attributes=None):
+        """
+        Completes the READY user task with the given name (or description), after setting the
+        given attributes on it.
+        """
+        return self._call(instance_id, 'complete_task', task_name, attributes)
+
+    def accept_message(self, instance_id, message):
+        """
+        Delivers the given message to the given instance. See BpmnWorkflow.accept_message().
+        """
+        return self._call(instance_id, 'accept_message', message)
+
+    def refresh_waiting_tasks(self, instance_id=None):
+        """
+        Refreshes the WAITING tasks (e.g. fires due timers) of the given instance, or of all
+        instances if no instance id is given. In the latter case, None is returned.
+        """
+        if instance_id is not None:
+            return self._call(instance_id, 'refresh_waiting_tasks')
+        for i in range(len(self._workers)):
+            self._call_worker(i, 'refresh_waiting_tasks')
+        return None
+
+    def get_status(self, instance_id):
+        """
+        Returns the status of the given instance.
+        """
+        return self._call(instance_id, 'get_status')
+
+    def save_workflow(self, instance_id):
+        """
+        Returns the spec name and the serialized state of the given instance. The instance is
+        kept; call remove_workflow() to hand it off.
+        """
+        return self._call(instance_id, 'save_workflow')
+
+    def load_workflow(self, instance_id, spec_name, state):
+        """
+        Restores an instance from the state that was returned by save_workflow().
+        """
+        return self._call(instance_id, 'load_workflow', spec_name, state)
+
+    def remove_workflow(self, instance_id):
+        """
+        Removes the given instance from its worker process.
+        """
+        self._call(instance_id, 'remove_workflow')
+
+    def get_instance_ids(self):
+        """
+        Returns the ids of all instances, in no particular order.
+        """
+        instance_ids = []
+        for i in range(len(self._workers)):
+            instance_ids.extend(self._call_worker(i, 'get_instance_ids'))
+        return instance_ids
+
+    def _call(self, instance_id, operation, *args):
+        return self._call_worker(self.get_shard(instance_id), operation, instance_id, *args)
+
+    def _call_worker(self, index, operation, *args):
+        process, conn, lock = self._workers[index]
+        with lock:
+            conn.send((operation, args))
+            success, result = conn.recv()
+        if not success:
+            raise RemoteWorkflowException(result)
+        return result
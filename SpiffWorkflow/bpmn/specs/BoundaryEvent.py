@@ -30,8 +30,7 @@ class _BoundaryEventParent(BpmnSpecMixin):
                 if sibling != child_task:
                     if sibling.task_spec == self.main_child_task_spec or (isinstance(sibling.task_spec, BoundaryEvent) and not sibling._is_finished()):
                         sibling.cancel()
-            for t in child_task.workflow._get_waiting_tasks():
-                t.task_spec._update_state(t)
+            child_task.workflow._wake_waiting_tasks()
 
     def _predict_hook(self, my_task):
         # We default to MAYBE
@@ -48,6 +47,9 @@ class _BoundaryEventParent(BpmnSpecMixin):
             if child.task_spec == self.main_child_task_spec:
                 child._set_state(state)
 
+    def _has_static_prediction(self):
+        return True
+
     def _should_cancel(self, task_spec):
         return issubclass(task_spec.__class__, BoundaryEvent) and task_spec._cancel_activity
 
@@ -50,7 +50,7 @@ class _EndJoin(UnstructuredJoin):
 
     def _on_complete_hook(self, my_task):
         super(_EndJoin, self)._on_complete_hook(my_task)
-        my_task.workflow.attributes.update(my_task.get_attributes())
+        my_task.workflow.attributes.update(my_task._peek_attributes())
 
 
 class BpmnProcessSpec(WorkflowSpec):
@@ -76,27 +76,9 @@ class BpmnProcessSpec(WorkflowSpec):
         """
         Returns a set of the distinct lane names used in the process (including called activities)
         """
-
-        done = set()
         lanes = set()
-
-        def recursive_find(task_spec):
-            if task_spec in done:
-                return
-
-            done.add(task_spec)
-
-            if hasattr(task_spec, 'lane') and task_spec.lane:
-                lanes.add(task_spec.lane)
-
-            if hasattr(task_spec, 'spec'):
-                recursive_find(task_spec.spec.start)
-
-            for t in task_spec.outputs:
-                recursive_find(t)
-
-        recursive_find(self.start)
-
+        for spec in self.get_specs_depth_first():
+            lanes.update(spec._get_graph().lanes)
         return lanes
 
     def get_specs_depth_first(self):
@@ -107,20 +89,18 @@ class BpmnProcessSpec(WorkflowSpec):
         done = set()
         specs = [self]
 
-        def recursive_find(task_spec):
-            if task_spec in done:
+        def recursive_find(spec):
+            if spec.start in done:
                 return
-
-            done.add(task_spec)
-
-            if hasattr(task_spec, 'spec'):
-                specs.append(task_spec.spec)
-                recursive_find(task_spec.spec.start)
-
-            for t in task_spec.outputs:
-                recursive_find(t)
-
-        recursive_find(self.start)
+            for task_spec in spec._get_graph().depth_first:
+                if task_spec in done:
+                    continue
+                done.add(task_spec)
+                if hasattr(task_spec, 'spec'):
+                    specs.append(task_spec.spec)
+                    recursive_find(task_spec.spec)
+
+        recursive_find(self)
 
         return specs
 
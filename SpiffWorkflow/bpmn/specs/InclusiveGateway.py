@@ -13,8 +13,6 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
-from collections import deque
-
 import logging
 from SpiffWorkflow.Task import Task
 from SpiffWorkflow.bpmn.specs.UnstructuredJoin import UnstructuredJoin
@@ -73,7 +71,7 @@ class InclusiveGateway(UnstructuredJoin):
                 continue
             tasks.append(task)
 
-        inputs_with_tokens, waiting_tasks = self._get_inputs_with_tokens(my_task)
+        inputs_with_tokens = self._get_inputs_with_tokens(my_task)
         inputs_without_tokens = filter(lambda i: i not in inputs_with_tokens, self.inputs)
 
         waiting_tasks = []
@@ -85,18 +83,6 @@ class InclusiveGateway(UnstructuredJoin):
         return force or len(waiting_tasks) == 0, waiting_tasks
 
     def _has_directed_path_to(self, task, task_spec, without_using_sequence_flow_from=None):
-        q = deque()
-        done = set()
-
-        without_using_sequence_flow_from = set(without_using_sequence_flow_from or [])
-
-        q.append(task.task_spec)
-        while q:
-            n = q.popleft()
-            if n == task_spec:
-                return True
-            for child in n.outputs:
-                if child not in done and not (n in without_using_sequence_flow_from and child==task_spec):
-                    done.add(child)
-                    q.append(child)
-        return False
+        graph = task_spec._parent._get_graph()
+        return graph.has_path_to(task.task_spec, task_spec,
+                                 without_using_inputs=set(without_using_sequence_flow_from or []))
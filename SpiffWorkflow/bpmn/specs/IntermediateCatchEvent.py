@@ -16,6 +16,7 @@
 
 from SpiffWorkflow.Task import Task
 from SpiffWorkflow.bpmn.specs.BpmnSpecMixin import BpmnSpecMixin
+from SpiffWorkflow.bpmn.specs.event_definitions import MessageEventDefinition
 from SpiffWorkflow.specs.Simple import Simple
 
 class IntermediateCatchEvent(Simple, BpmnSpecMixin):
@@ -44,6 +45,19 @@ class IntermediateCatchEvent(Simple, BpmnSpecMixin):
                 if not my_task.workflow._is_busy_with_restore():
                     self.entering_waiting_state(my_task)
 
+    def _wakeup_task_specs(self):
+        # Messages are delivered through accept_message(), which updates
+        # the task directly. Timers may fire at any time.
+        if isinstance(self.event_definition, MessageEventDefinition):
+            return []
+        return None
+
+    def _get_wake_time(self, my_task):
+        return self.event_definition._get_wake_time(my_task)
+
+    def _get_wait_handle(self, my_task):
+        return self.event_definition._get_wait_handle(my_task)
+
     def _on_ready_hook(self, my_task):
         self._predict(my_task)
 
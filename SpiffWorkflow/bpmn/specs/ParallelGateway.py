@@ -37,8 +37,18 @@ class ParallelGateway(UnstructuredJoin):
 
     """
 
+    def _wakeup_task_specs(self):
+        return self.inputs
+
     def _try_fire_unstructured(self, my_task, force=False):
-        completed_inputs, waiting_tasks = self._get_inputs_with_tokens(my_task)
+        completed_inputs = self._get_inputs_with_tokens(my_task)
+
+        # The waiting tasks are only needed to cancel the remaining
+        # branches.
+        if self.cancel_remaining:
+            waiting_tasks = self._get_waiting_tasks(my_task)
+        else:
+            waiting_tasks = []
 
         # If the threshold was reached, get ready to fire.
         return force or len(completed_inputs) >= len(self.inputs), waiting_tasks
@@ -31,10 +31,14 @@ class ScriptTask(Simple, BpmnSpecMixin):
         super(ScriptTask, self).__init__(parent, name, **kwargs)
         self.script = script
 
-    def _on_complete_hook(self, task):
+    def _prepare_hook(self, task):
         if task.workflow._is_busy_with_restore():
             return
         assert not task.workflow.read_only
         task.workflow.script_engine.execute(task, self.script)
+
+    def _on_complete_hook(self, task):
+        if task.workflow._is_busy_with_restore():
+            return
         super(ScriptTask, self)._on_complete_hook(task)
 
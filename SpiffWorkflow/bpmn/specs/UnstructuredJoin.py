@@ -30,32 +30,41 @@ class UnstructuredJoin(Join, BpmnSpecMixin):
     def _try_fire_unstructured(self, my_task, force=False):
         raise NotImplementedError("Please implement this in the subclass")
 
+    def _wakeup_task_specs(self):
+        # Subclasses decide what they wait for.
+        return None
+
+    def _counts_tokens(self):
+        return True
+
     def _get_inputs_with_tokens(self, my_task):
-        # Look at the tree to find all places where this task is used.
-        tasks = []
-        for task in my_task.workflow.task_tree:
-            if task.thread_id != my_task.thread_id:
-                continue
+        # Look up which inputs have a completed task waiting here. The
+        # workflow keeps track of the tokens as the inputs complete.
+        tokens = my_task.workflow._get_tokens(my_task.thread_id, self)
+        completed_inputs = set()
+        for input, tasks in tokens.iteritems():
+            for task in tasks:
+                if not task.parent._has_state(Task.COMPLETED):
+                    continue
+                if not task._has_state(Task.WAITING) and task != my_task:
+                    continue
+                if input in completed_inputs:
+                    raise NotImplementedError("Unsupported looping behaviour: two threads waiting on the same sequence flow.")
+                completed_inputs.add(input)
+        return completed_inputs
+
+    def _get_waiting_tasks(self, my_task):
+        # Look at the tree to find the inputs that did not complete yet.
+        waiting_tasks = []
+        for task in my_task.workflow._get_thread_tasks(my_task.thread_id, self):
             if task.workflow != my_task.workflow:
                 continue
-            if task.task_spec != self:
-                continue
             if task._is_finished():
                 continue
-            tasks.append(task)
-
-        # Look up which tasks have parent's completed.
-        waiting_tasks = []
-        completed_inputs = set()
-        for task in tasks:
             if task.parent._has_state(Task.COMPLETED) and (task._has_state(Task.WAITING) or task == my_task):
-                if task.parent.task_spec in completed_inputs:
-                    raise NotImplementedError("Unsupported looping behaviour: two threads waiting on the same sequence flow.")
-                completed_inputs.add(task.parent.task_spec)
-            else:
-                waiting_tasks.append(task.parent)
-
-        return completed_inputs, waiting_tasks
+                continue
+            waiting_tasks.append(task.parent)
+        return waiting_tasks
 
     def _do_join(self, my_task):
         # Copied from Join parent class
@@ -71,13 +80,17 @@ class UnstructuredJoin(Join, BpmnSpecMixin):
         # pattern, we only join within the same thread. (Both patterns
         # may also be mixed.)
         #
-        # We are looking for all task instances that must be joined.
-        # We limit our search by starting at the split point.
+        # The instances that must be joined are those that hold a token,
+        # i.e. those whose incoming branch is finished.
+        tokens = my_task.workflow._get_tokens(my_task.thread_id, self)
+        candidates = set()
+        for tasks in tokens.itervalues():
+            candidates.update(tasks)
         if self.split_task:
             split_task = my_task.workflow.get_task_spec_from_name(self.split_task)
             split_task = my_task._find_ancestor(split_task)
-        else:
-            split_task = my_task.workflow.task_tree
+            candidates = set(task for task in candidates
+                             if task._is_descendant_of(split_task))
 
         # Identify all corresponding task instances within the thread.
         # Also remember which of those instances was most recently changed,
@@ -86,24 +99,10 @@ class UnstructuredJoin(Join, BpmnSpecMixin):
         # to build the task tree underneath the most recently changed task.
         last_changed = None
         thread_tasks = []
-        for task in split_task._find_any(self):
-            # Ignore tasks from other threads.
-            if task.thread_id != my_task.thread_id:
-                continue
-            # Ignore tasks from other subprocesses:
-            if task.workflow != my_task.workflow:
-                continue
-
+        for task in my_task.workflow._sort_tasks(candidates):
             # Ignore my outgoing branches.
             if task._is_descendant_of(my_task):
                 continue
-            # Ignore completed tasks (this is for loop handling)
-            if task._is_finished():
-                continue
-
-            #For an inclusive join, this can happen - it's a future join
-            if not task.parent._is_finished():
-                continue
 
             # We have found a matching instance.
             thread_tasks.append(task)
@@ -15,6 +15,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 
 import datetime
+import time
 
 class CatchingEventDefinition(object):
     """
@@ -32,6 +33,12 @@ class CatchingEventDefinition(object):
     def _accept_message(self, my_task, message):
         return False
 
+    def _get_wake_time(self, my_task):
+        return None
+
+    def _get_wait_handle(self, my_task):
+        return None
+
     def _fire(self, my_task):
         my_task._set_internal_attribute(event_fired=True)
 
@@ -91,9 +98,22 @@ class TimerEventDefinition(CatchingEventDefinition):
         dt = my_task.workflow.script_engine.evaluate(my_task, self.dateTime)
         if dt is None:
             return False
+        return self._now(dt) > dt
+
+    def _get_wake_time(self, my_task):
+        dt = my_task.workflow.script_engine.evaluate(my_task, self.dateTime)
+        if dt is None:
+            return None
+        delta = dt - self._now(dt)
+        seconds = delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+        # has_fired() requires the time to be strictly after dt.
+        return time.time() + max(seconds, 0) + 0.001
+
+    def _now(self, dt):
+        """
+        Returns the current time, in the time zone of the given datetime.
+        """
         if dt.tzinfo:
             tz = dt.tzinfo
-            now =  tz.fromutc(datetime.datetime.utcnow().replace(tzinfo=tz))
-        else:
-            now = datetime.datetime.now()
-        return now > dt
+            return tz.fromutc(datetime.datetime.utcnow().replace(tzinfo=tz))
+        return datetime.datetime.now()
@@ -159,7 +159,8 @@ class _BpmnProcessSpecState(object):
             return
         task._set_state(Task.COMPLETED)
 
-        task.children = []
+        for child in task.children[:]:
+            task._remove_child(child)
         for task_spec in target_children_specs:
             task._add_child(task_spec)
 
@@ -174,7 +175,8 @@ class _BpmnProcessSpecState(object):
         subworkflow.completed_event.connect(my_task.task_spec._on_subworkflow_completed, my_task)
 
         # Create the children (these are the tasks that follow the subworkflow, on completion:
-        my_task.children = []
+        for child in my_task.children[:]:
+            my_task._remove_child(child)
         my_task._sync_children(my_task.task_spec.outputs, Task.FUTURE)
         for t in my_task.children:
             t.task_spec._predict(t)
@@ -183,8 +185,8 @@ class _BpmnProcessSpecState(object):
         # Integrate the tree of the subworkflow into the tree of this workflow.
         for child in subworkflow.task_tree.children:
             if child.task_spec in target_children_specs:
-                my_task.children.insert(0, child)
-                child.parent = my_task
+                my_task._insert_child(0, child)
+        my_task.workflow._subworkflow_merged_notify(subworkflow)
 
         my_task._set_internal_attribute(subworkflow = subworkflow)
 
@@ -209,6 +211,14 @@ class _BpmnProcessSpecState(object):
         q = deque()
         done = set()
         q.append(starting_route)
+
+        # Only follow task specs from which the target can be reached.
+        graph = starting_route[-1]._parent._get_graph()
+        if task_name:
+            targets = set(t for t in graph.task_specs if t.name == task_name)
+        else:
+            targets = set(t for t in graph.task_specs
+                          if hasattr(t, 'has_outgoing_sequence_flow') and t.has_outgoing_sequence_flow(transition_id))
         while q:
             route = q.popleft()
             if not route[-1] == starting_route[-1]:
@@ -227,6 +237,8 @@ class _BpmnProcessSpecState(object):
                         route.append(spec)
                         return route
             for child in route[-1].outputs:
+                if graph.reachable[child].isdisjoint(targets):
+                    continue
                 new_route = route + [child]
                 if len(new_route) > 10000:
                     raise ValueError('Maximum looping limit exceeded searching for path to %s' % (task_name or transition_id))
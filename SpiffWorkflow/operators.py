@@ -130,7 +130,7 @@ def valueof(scope, op):
     if op is None:
         return None
     elif isinstance(op, Attrib):
-        if op.name not in scope.attributes:
+        if op.name not in scope._peek_attributes():
             LOG.debug("Attrib('%s') not present in task '%s' attributes" %
                     (op.name, scope.get_name()))
         return scope.get_attribute(op.name)
@@ -138,12 +138,12 @@ def valueof(scope, op):
         if not op.path:
             return None
         parts = op.path.split('/')
-        data = scope.attributes
+        data = scope._peek_attributes()
         for part in parts:
             if part not in data:
                 LOG.debug("PathAttrib('%s') not present in task '%s' "
                         "attributes" % (op.path, scope.get_name()),
-                        extra=dict(data=scope.attributes))
+                        extra=dict(data=scope._peek_attributes()))
                 return None
             data = data[part]  # move down the path
         return data
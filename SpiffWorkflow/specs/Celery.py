@@ -240,6 +240,16 @@ class Celery(TaskSpec):
                             my_task.get_name()))
             return False
 
+    def _wakeup_task_specs(self):
+        # Only the result of the call may let the task proceed.
+        return []
+
+    def _get_wait_handle(self, my_task):
+        async_call = getattr(my_task, 'async_call', None)
+        if async_call is None or async_call.ready():
+            return None
+        return lambda: async_call.get(propagate=False)
+
     def _update_state_hook(self, my_task):
         if not self._try_fire(my_task):
             if not my_task._has_state(Task.WAITING):
@@ -70,6 +70,9 @@ class ExclusiveChoice(MultiChoice):
         spec = self._parent.get_task_spec_from_name(self.default_task_spec)
         my_task._set_likely_task(spec)
 
+    def _has_static_prediction(self):
+        return True
+
     def _on_complete_hook(self, my_task):
         # Find the first matching condition.
         output = self._parent.get_task_spec_from_name(self.default_task_spec)
@@ -58,6 +58,12 @@ class Execute(TaskSpec):
                                                stdout=subprocess.PIPE)
 
         if my_task.subprocess:
+            if getattr(my_task, 'results', None) is not None:
+                # Collected by _wait_for_subprocess().
+                return True
+            if getattr(my_task, 'subprocess_waited', False):
+                # The wait handle owns the process until it returned.
+                return False
             my_task.subprocess.poll()
             if my_task.subprocess.returncode is None:
                 # Still waiting
@@ -68,6 +74,25 @@ class Execute(TaskSpec):
                 return True
         return False
 
+    def _wakeup_task_specs(self):
+        # Only the process may let the task proceed.
+        return []
+
+    def _get_wait_handle(self, my_task):
+        if getattr(my_task, 'subprocess', None) is None \
+          or getattr(my_task, 'results', None) is not None:
+            return None
+        # From now on, only the handle reads from the process, so that
+        # _try_fire() does not poll it while the handle communicates.
+        my_task.subprocess_waited = True
+        return lambda: self._wait_for_subprocess(my_task)
+
+    def _wait_for_subprocess(self, my_task):
+        try:
+            my_task.results = my_task.subprocess.communicate()
+        finally:
+            my_task.subprocess_waited = False
+
     def _update_state_hook(self, my_task):
         if not self._try_fire(my_task):
             my_task.state = Task.WAITING
@@ -47,12 +47,16 @@ class Gate(TaskSpec):
         TaskSpec.__init__(self, parent, name, **kwargs)
         self.context = context
 
+    def _referenced_task_specs(self):
+        return [self._parent.get_task_spec_from_name(self.context)]
+
+    def _wakeup_task_specs(self):
+        return [self._parent.get_task_spec_from_name(self.context)]
+
     def _update_state_hook(self, my_task):
         context_task = my_task.workflow.get_task_spec_from_name(self.context)
-        root_task    = my_task.workflow.task_tree
-        for task in root_task._find_any(context_task):
-            if task.thread_id != my_task.thread_id:
-                continue
+        workflow     = my_task.workflow
+        for task in workflow._get_thread_tasks(my_task.thread_id, context_task):
             if not task._has_state(Task.COMPLETED):
                 my_task._set_state(Task.WAITING)
                 return
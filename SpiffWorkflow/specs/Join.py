@@ -105,6 +105,7 @@ class Join(TaskSpec):
         return True
 
     def _branch_may_merge_at(self, task):
+        predict_all = task.workflow.prediction == Task.PREDICT_ALL
         for child in task:
             # Ignore tasks that were created by a trigger.
             if child.triggered:
@@ -112,14 +113,42 @@ class Join(TaskSpec):
             # Merge found.
             if child.task_spec == self:
                 return True
+            if child._is_definite():
+                continue
             # If the task is predicted with less outputs than he has
             # children, that means the prediction may be incomplete (for
             # example, because a prediction is not yet possible at this time).
-            if not child._is_definite() \
-                and len(child.task_spec.outputs) > len(child.children):
-                return True
+            if predict_all or child.children:
+                if len(child.task_spec.outputs) > len(child.children):
+                    return True
+                continue
+            # Unless all predictions are made, the children of the task
+            # may not have been added yet. They would be predicted from
+            # its outputs, and would be incomplete in turn if they have
+            # outputs of their own.
+            for output in child.task_spec.outputs:
+                if output == self or output.outputs:
+                    return True
         return False
 
+    def _referenced_task_specs(self):
+        return [self] + list(self.inputs)
+
+    def _split_task_specs(self):
+        split_task = self._parent.task_specs.get(self.split_task)
+        if split_task is None:
+            return []
+        return [split_task]
+
+    def _wakeup_task_specs(self):
+        # A structured join inspects the whole branch, and a threshold
+        # that is read from the attributes may change at any time.
+        if self.split_task is not None:
+            return None
+        if self.threshold is not None and not isinstance(self.threshold, int):
+            return None
+        return self.inputs
+
     def _try_fire_unstructured(self, my_task, force=False):
         # The default threshold is the number of inputs.
         threshold = valueof(my_task, self.threshold)
@@ -129,12 +158,8 @@ class Join(TaskSpec):
         # Look at the tree to find all places where this task is used.
         tasks = []
         for input in self.inputs:
-            for task in my_task.workflow.task_tree:
-                if task.thread_id != my_task.thread_id:
-                    continue
-                if task.task_spec != input:
-                    continue
-                tasks.append(task)
+            tasks += my_task.workflow._get_thread_tasks(my_task.thread_id,
+                                                        input)
 
         # Look up which tasks have already completed.
         waiting_tasks = []
@@ -280,9 +305,7 @@ class Join(TaskSpec):
         May be called to fire the Join before the incoming branches are
         completed.
         """
-        for task in my_task.workflow.task_tree._find_any(self):
-            if task.thread_id != my_task.thread_id:
-                continue
+        for task in my_task.workflow._get_thread_tasks(my_task.thread_id, self):
             self._do_join(task)
 
     def serialize(self, serializer):
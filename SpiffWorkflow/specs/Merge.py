@@ -34,9 +34,9 @@ class Merge(Join):
             for task in tasks:
                 LOG.debug("Merging %s (%s) into %s" % (task.get_name(),
                         task.get_state_name(), self.name),
-                        extra=dict(data=task.attributes))
-                _log_overwrites(my_task.attributes, task.attributes)
-                merge_dictionary(my_task.attributes, task.attributes)
+                        extra=dict(data=task._peek_attributes()))
+                _log_overwrites(my_task.attributes, task._peek_attributes())
+                merge_dictionary(my_task.attributes, task._peek_attributes())
         return super(Merge, self)._do_join(my_task)
 
     @classmethod
@@ -59,6 +59,10 @@ class MultiChoice(TaskSpec):
         self.cond_task_specs.append((condition, task_spec.name))
         task_spec._connect_notify(self)
 
+    def _freeze(self):
+        self.cond_task_specs = tuple(self.cond_task_specs)
+        super(MultiChoice, self)._freeze()
+
     def test(self):
         """
         Checks whether all required attributes are set. Throws an exception
@@ -80,14 +84,29 @@ class MultiChoice(TaskSpec):
     def _on_trigger(self, my_task, choice):
         """
         Lets a caller narrow down the choice by using a Choose trigger.
+        If the task spec is frozen, the choice only applies to the given
+        task.
         """
-        self.choice = choice
+        if self.is_frozen():
+            my_task._set_internal_attribute(choice=choice)
+        else:
+            self.choice = choice
         # The caller needs to make sure that predict() is called.
 
+    def _get_choice(self, my_task):
+        """
+        Returns the names of the outputs that the given task may choose
+        from, or None if it may choose any output.
+        """
+        if not self.is_frozen():
+            return self.choice
+        return my_task._get_internal_attribute('choice', self.choice)
+
     def _predict_hook(self, my_task):
-        if self.choice:
+        choice = self._get_choice(my_task)
+        if choice:
             outputs = [self._parent.get_task_spec_from_name(o)
-                       for o in self.choice]
+                       for o in choice]
         else:
             outputs = self.outputs
 
@@ -118,9 +137,10 @@ class MultiChoice(TaskSpec):
         Returns True if completed, False otherwise.
         """
         # Find all matching conditions.
+        choice = self._get_choice(my_task)
         outputs = []
         for condition, output in self.cond_task_specs:
-            if self.choice is not None and output not in self.choice:
+            if choice is not None and output not in choice:
                 continue
             if condition is None:
                 outputs.append(self._parent.get_task_spec_from_name(output))
@@ -45,12 +45,13 @@ class MultiInstance(TaskSpec):
         TaskSpec.__init__(self, parent, name, **kwargs)
         self.times = times
 
+    def _referenced_task_specs(self):
+        return [self]
+
     def _find_my_task(self, task):
-        for thetask in task.workflow.task_tree:
-            if thetask.thread_id != task.thread_id:
-                continue
-            if thetask.task_spec == self:
-                return thetask
+        tasks = task.workflow._get_thread_tasks(task.thread_id, self)
+        if tasks:
+            return tasks[0]
         return None
 
     def _on_trigger(self, task_spec):
@@ -93,6 +94,9 @@ class MultiInstance(TaskSpec):
         else:
             my_task._sync_children(outputs, Task.LIKELY)
 
+    def _has_static_prediction(self):
+        return True
+
     def _on_complete_hook(self, my_task):
         outputs = self._get_predicted_outputs(my_task)
         my_task._sync_children(outputs, Task.FUTURE)
@@ -0,0 +1,358 @@
+# Copyright (C) 2007 Samuel Abels
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+class SpecGraph(object):
+    """
+    The static analysis of the graph that is formed by the task specs of
+    a workflow spec, i.e. facts that do not depend on any running
+    workflow. It is computed by L{WorkflowSpec.compile()}, and is only
+    valid until the spec is changed.
+
+    The following tables are computed up front::
+
+        - components: The strongly connected components, in reverse
+          topological order (components without outputs come first).
+        - component: Maps each task spec to the index of its component.
+        - rank: Maps each task spec to the topological rank of its
+          component; 0 for components without inputs.
+        - reachable: Maps each task spec to the set of task specs that
+          can be reached from it through its outputs, including itself.
+        - depth_first: The task specs that can be reached from the start
+          task, in depth first order.
+        - lanes: Maps each lane to the set of task specs in that lane
+          that can be reached from the start task.
+
+    Other tables are computed when they are first needed.
+    """
+
+    def __init__(self, wf_spec):
+        """
+        Constructor.
+
+        :type  wf_spec: WorkflowSpec
+        :param wf_spec: The workflow spec.
+        """
+        self.wf_spec = wf_spec
+        self.task_specs = self._find_task_specs(wf_spec)
+        self.predecessors = dict((task_spec, []) for task_spec in self.task_specs)
+        for task_spec in self.task_specs:
+            for output in task_spec.outputs:
+                self.predecessors[output].append(task_spec)
+        self._find_components()
+        self._find_ranks()
+        self._find_reachable()
+        self.depth_first = self._walk_depth_first(wf_spec.start)
+        self.lanes = {}
+        for task_spec in self.depth_first:
+            lane = getattr(task_spec, 'lane', None)
+            if lane:
+                self.lanes.setdefault(lane, set()).add(task_spec)
+        self._ancestors = {}
+        self._paths_to = {}
+
+    def _find_task_specs(self, wf_spec):
+        """
+        Returns all task specs of the workflow spec, including those that
+        are only referenced as an output, ordered by id.
+        """
+        task_specs = []
+        done = set()
+        stack = sorted(wf_spec.task_specs.itervalues(), key=lambda t: t.id,
+                       reverse=True)
+        while stack:
+            task_spec = stack.pop()
+            if task_spec in done:
+                continue
+            done.add(task_spec)
+            task_specs.append(task_spec)
+            stack.extend(task_spec.outputs)
+        return task_specs
+
+    def _find_components(self):
+        """
+        Tarjan's algorithm, without recursion.
+        """
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        self.components = []
+        self.component = {}
+        for root in self.task_specs:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(root.outputs))]
+            while work:
+                task_spec, outputs = work[-1]
+                for output in outputs:
+                    if output not in index:
+                        index[output] = lowlink[output] = len(index)
+                        stack.append(output)
+                        on_stack.add(output)
+                        work.append((output, iter(output.outputs)))
+                        break
+                    if output in on_stack:
+                        lowlink[task_spec] = min(lowlink[task_spec],
+                                                 index[output])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent],
+                                              lowlink[task_spec])
+                    if lowlink[task_spec] != index[task_spec]:
+                        continue
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        self.component[member] = len(self.components)
+                        component.append(member)
+                        if member is task_spec:
+                            break
+                    self.components.append(component)
+
+    def _find_ranks(self):
+        """
+        Assigns the longest distance from a component without inputs to
+        each component, walking the components in topological order.
+        """
+        ranks = [0] * len(self.components)
+        for n in reversed(range(len(self.components))):
+            for task_spec in self.components[n]:
+                for output in task_spec.outputs:
+                    m = self.component[output]
+                    if m != n:
+                        ranks[m] = max(ranks[m], ranks[n] + 1)
+        self.rank = dict((task_spec, ranks[self.component[task_spec]])
+                         for task_spec in self.task_specs)
+
+    def _find_reachable(self):
+        """
+        Collects the reachable task specs per component. Components are
+        visited after all components that they lead to.
+        """
+        reachable = []
+        for n, component in enumerate(self.components):
+            result = set(component)
+            for task_spec in component:
+                for output in task_spec.outputs:
+                    m = self.component[output]
+                    if m != n:
+                        result.update(reachable[m])
+            reachable.append(frozenset(result))
+        self.reachable = dict((task_spec, reachable[self.component[task_spec]])
+                              for task_spec in self.task_specs)
+
+    def _walk_depth_first(self, start):
+        """
+        Returns the task specs that can be reached from the given one, in
+        the order of a recursive depth first walk through the outputs.
+        """
+        result = [start]
+        done = set(result)
+        work = [iter(start.outputs)]
+        while work:
+            for output in work[-1]:
+                if output not in done:
+                    done.add(output)
+                    result.append(output)
+                    work.append(iter(output.outputs))
+                    break
+            else:
+                work.pop()
+        return result
+
+    def can_reach(self, task_spec, target):
+        """
+        Returns True if the given target can be reached from the given
+        task spec, or if both are the same.
+
+        :type  task_spec: TaskSpec
+        :param task_spec: The task spec where the path starts.
+        :type  target: TaskSpec
+        :param target: The task spec where the path ends.
+        :rtype:  boolean
+        :returns: True if there is a path, False otherwise.
+        """
+        reachable = self.reachable.get(task_spec)
+        return reachable is not None and target in reachable
+
+    def get_ancestors(self, task_spec):
+        """
+        Returns the task specs from which the given one can be reached, in
+        the order of L{TaskSpec.ancestors()}.
+
+        :type  task_spec: TaskSpec
+        :param task_spec: The task spec.
+        :rtype:  list(TaskSpec)
+        :returns: The ancestors. The list must not be modified.
+        """
+        ancestors = self._ancestors.get(task_spec)
+        if ancestors is not None:
+            return ancestors
+        ancestors = []
+        done = set()
+        work = [iter(task_spec.inputs)]
+        while work:
+            for input in work[-1]:
+                if input not in done:
+                    done.add(input)
+                    ancestors.append(input)
+                    work.append(iter(input.inputs))
+                    break
+            else:
+                work.pop()
+        self._ancestors[task_spec] = ancestors
+        return ancestors
+
+    def has_path_to(self, task_spec, target, without_using_inputs=None):
+        """
+        Returns True if the given target can be reached from the given
+        task spec, without passing through the target, and without using
+        the connections from the given inputs of the target.
+
+        :type  task_spec: TaskSpec
+        :param task_spec: The task spec where the path starts.
+        :type  target: TaskSpec
+        :param target: The task spec where the path ends.
+        :type  without_using_inputs: list(TaskSpec)
+        :param without_using_inputs: Inputs of the target whose connection
+                                     to the target may not be used.
+        :rtype:  boolean
+        :returns: True if there is a path, False otherwise.
+        """
+        if task_spec == target:
+            return True
+        paths_to = self._paths_to.get(target)
+        if paths_to is None:
+            paths_to = self._find_paths_to(target)
+            self._paths_to[target] = paths_to
+        excluded = without_using_inputs or ()
+        for input, sources in paths_to:
+            if input not in excluded and task_spec in sources:
+                return True
+        return False
+
+    def find_cycles(self, select):
+        """
+        Finds a cycle through each of the selected task specs that is part
+        of one. Each strongly connected component is walked only twice,
+        so the time taken is linear in the size of the graph, plus the
+        length of the cycles that are returned.
+
+        :type  select: callable
+        :param select: Called with each task spec; returns True if a cycle
+                       through the task spec should be returned.
+        :rtype:  list((TaskSpec, list(TaskSpec)))
+        :returns: A list of (task_spec, path) tuples, where the path starts
+                  with the task spec, and follows the inputs until the next
+                  step would lead back to the task spec.
+        """
+        position = dict((t, n) for n, t in enumerate(self.task_specs))
+        cycles = []
+        for members in self.components:
+            selected = sorted((t for t in members if select(t)),
+                              key=position.get)
+            if not selected:
+                continue
+            root = selected[0]
+            if len(members) == 1 and root not in root.outputs:
+                continue
+            up = self._walk_component(root, 'inputs')
+            down = self._walk_component(root, 'outputs')
+            for task_spec in selected:
+                cycles.append((task_spec, self._get_cycle(task_spec, root,
+                                                          up, down)))
+        return cycles
+
+    def _walk_component(self, root, direction):
+        """
+        Walks the component of the given task spec breadth first, in the
+        given direction. Returns a dictionary that maps each task spec to
+        the task spec from which it was reached, and a list of all task
+        specs in the order in which they were reached.
+        """
+        component = self.component[root]
+        came_from = {root: None}
+        order = [root]
+        for task_spec in order:
+            for neighbour in getattr(task_spec, direction):
+                if neighbour in came_from \
+                        or self.component.get(neighbour) != component:
+                    continue
+                came_from[neighbour] = task_spec
+                order.append(neighbour)
+        return came_from, order
+
+    def _get_cycle(self, task_spec, root, up, down):
+        """
+        Returns a simple cycle through the given task spec, in the order of
+        the inputs, built from the walks of its component.
+        """
+        came_from_input, order = up
+        came_from_output = down[0]
+
+        # The path from the root to the task spec, following the inputs.
+        if task_spec is root:
+            # The closest task spec that has the root as an input.
+            outputs = set(root.outputs)
+            last = [t for t in order if t in outputs][0]
+        else:
+            last = task_spec
+        to_task_spec = []
+        while last is not None:
+            to_task_spec.append(last)
+            last = came_from_input[last]
+        to_task_spec.reverse()
+        if task_spec is root:
+            return to_task_spec
+
+        # The path from the task spec to the root, following the inputs.
+        # It is cut short where it meets the other path.
+        index = dict((t, n) for n, t in enumerate(to_task_spec))
+        path = [task_spec]
+        current = came_from_output[task_spec]
+        while current not in index:
+            path.append(current)
+            current = came_from_output[current]
+        path.append(current)
+        return path + to_task_spec[index[current] + 1:-1]
+
+    def _find_paths_to(self, target):
+        """
+        Returns, for each task spec that leads to the target, the set of
+        task specs from which it can be reached without passing through
+        the target.
+        """
+        paths_to = []
+        for input in self.predecessors.get(target, ()):
+            if input == target:
+                continue
+            sources = set([input])
+            queue = [input]
+            while queue:
+                task_spec = queue.pop()
+                for predecessor in self.predecessors[task_spec]:
+                    if predecessor != target and predecessor not in sources:
+                        sources.add(predecessor)
+                        queue.append(predecessor)
+            paths_to.append((input, frozenset(sources)))
+        return paths_to
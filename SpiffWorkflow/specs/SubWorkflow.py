@@ -78,6 +78,9 @@ class SubWorkflow(TaskSpec):
         else:
             my_task._sync_children(outputs, my_task.state)
 
+    def _has_static_prediction(self):
+        return True
+
     def _create_subworkflow(self, my_task):
         from SpiffWorkflow.storage import XmlSerializer
         from SpiffWorkflow.specs import WorkflowSpec
@@ -98,8 +101,8 @@ class SubWorkflow(TaskSpec):
             child.task_spec._update_state(child)
             child._inherit_attributes()
         for child in subworkflow.task_tree.children:
-            my_task.children.insert(0, child)
-            child.parent = my_task
+            my_task._insert_child(0, child)
+        my_task.workflow._subworkflow_merged_notify(subworkflow)
 
         my_task._set_internal_attribute(subworkflow = subworkflow)
 
@@ -16,6 +16,7 @@
 import logging
 
 from SpiffWorkflow.util.event import Event
+from SpiffWorkflow.util.impl import FrozenDict
 from SpiffWorkflow.Task import Task
 from SpiffWorkflow.exceptions import WorkflowException
 
@@ -115,6 +116,40 @@ class TaskSpec(object):
         self.properties.update(self.defines)
         assert self.id is not None
 
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            msg = 'Task spec is frozen, can not set %s' % name
+            raise WorkflowException(self, msg)
+        object.__setattr__(self, name, value)
+
+    def _freeze(self):
+        """
+        Called by L{WorkflowSpec.freeze()}. Makes the task spec read-only,
+        so that it can be shared by any number of workflows. All state of
+        a running workflow is kept in its tasks instead.
+
+        May be overwritten to freeze further attributes; the
+        implementation must call the parent method last.
+        """
+        self.inputs      = tuple(self.inputs)
+        self.outputs     = tuple(self.outputs)
+        self.properties  = FrozenDict(self.properties)
+        self.defines     = FrozenDict(self.defines)
+        self.pre_assign  = tuple(self.pre_assign)
+        self.post_assign = tuple(self.post_assign)
+        self.locks       = tuple(self.locks)
+        self._frozen     = True
+
+    def is_frozen(self):
+        """
+        Returns True if the task spec was frozen by
+        L{WorkflowSpec.freeze()}.
+
+        :rtype:  boolean
+        :returns: True if the task spec is read-only.
+        """
+        return self.__dict__.get('_frozen', False)
+
     def _connect_notify(self, taskspec):
         """
         Called by the previous task to let us know that it exists.
@@ -122,20 +157,14 @@ class TaskSpec(object):
         :type  taskspec: TaskSpec
         :param taskspec: The task by which this method is executed.
         """
+        if self.is_frozen():
+            raise WorkflowException(self, 'Task spec is frozen.')
         self.inputs.append(taskspec)
+        self._parent._connect_notify(self)
 
     def ancestors(self):
         """Returns list of ancestor task specs based on inputs"""
-        results = []
-
-        def recursive_find_ancestors(task, stack):
-            for input in task.inputs:
-                if input not in stack:
-                    stack.append(input)
-                    recursive_find_ancestors(input, stack)
-        recursive_find_ancestors(self, results)
-
-        return results
+        return list(self._parent._get_graph().get_ancestors(self))
 
     def _get_activated_tasks(self, my_task, destination):
         """
@@ -161,10 +190,83 @@ class TaskSpec(object):
         """
         return my_task.children
 
+    def _referenced_task_specs(self):
+        """
+        Returns the task specs whose tasks are looked up in the task tree
+        by a task of this spec, e.g. by a Join that counts its inputs.
+        Finished tasks of these specs are never archived by
+        Workflow.compact().
+
+        :rtype:  list(TaskSpec)
+        :returns: The referenced task specs.
+        """
+        return []
+
+    def _split_task_specs(self):
+        """
+        Returns the task specs whose branches are inspected as a whole
+        by a task of this spec, e.g. by a structured Join that counts
+        the branches of its split task. A task of these specs is never
+        compacted by Workflow.compact() while any task in its subtree
+        is unfinished.
+
+        :rtype:  list(TaskSpec)
+        :returns: The task specs at which the inspected branches start.
+        """
+        return []
+
+    def _wakeup_task_specs(self):
+        """
+        Returns the task specs whose completion may allow a WAITING task
+        of this spec to proceed. The Workflow only re-evaluates a WAITING
+        task when a task of one of these specs completes.
+        Returns None if the task may depend on any change in the tree,
+        which is the default.
+
+        :rtype:  list(TaskSpec)|None
+        :returns: The task specs that the task waits for, or None.
+        """
+        return None
+
+    def _get_wake_time(self, my_task):
+        """
+        Returns the time after which the given WAITING task may proceed,
+        in seconds since the epoch, like time.time(). A
+        L{SpiffWorkflow.WorkflowRunner} updates the task at that time,
+        without a thread of its own. Returns None if the task does not
+        wait for a point in time, which is the default.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :rtype:  float|None
+        :returns: The time at which the task may proceed, or None.
+        """
+        return None
+
+    def _get_wait_handle(self, my_task):
+        """
+        Returns a callable that blocks until the given WAITING task may
+        proceed, e.g. until an external process exited. A
+        L{SpiffWorkflow.WorkflowRunner} calls it in a background thread
+        and updates the task once it returned, instead of polling it.
+        Tasks that wait for a point in time should implement
+        _get_wake_time() instead, which needs no thread.
+        Returns None if there is nothing to wait for outside of the
+        workflow, which is the default.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        :rtype:  callable|None
+        :returns: A callable without arguments, or None.
+        """
+        return None
+
     def set_property(self, **kwargs):
         """
         Defines the given property name/value pairs.
         """
+        if self.is_frozen():
+            raise WorkflowException(self, 'Task spec is frozen.')
         for key in kwargs:
             if key in self.defines:
                 msg = "Property %s can not be modified" % key
@@ -191,6 +293,8 @@ class TaskSpec(object):
         :type  taskspec: TaskSpec
         :param taskspec: The new output task.
         """
+        if self.is_frozen():
+            raise WorkflowException(self, 'Task spec is frozen.')
         self.outputs.append(taskspec)
         taskspec._connect_notify(self)
 
@@ -224,27 +328,84 @@ class TaskSpec(object):
 
         Should NOT be overwritten! Instead, overwrite _predict_hook().
 
+        The prediction of a MAYBE or LIKELY task is remembered. Predicting
+        the task again does nothing until the state, the children or the
+        attributes of a task in its branch change, unless the branch
+        contains a task spec without a static prediction (see
+        _has_static_prediction()).
+
+        If the workflow only predicts definite tasks (see
+        Workflow.prediction), the branch of a MAYBE or LIKELY task is only
+        predicted when the prediction starts at that task.
+
         :type  my_task: Task
         :param my_task: The associated task in the task tree.
-        :type  seen: list[taskspec]
-        :param seen: A list of already visited tasks.
+        :type  seen: set(TaskSpec)
+        :param seen: The specs of the predicted tasks on the path from the
+                     task where the prediction started.
         :type  looked_ahead: integer
         :param looked_ahead: The depth of the predicted path so far.
         """
-        if my_task._is_finished():
+        if seen is not None:
+            self._predict_branch(my_task, seen, looked_ahead)
             return
-        if seen is None:
-            seen = []
-        elif self in seen:
+        if my_task._prediction_state == my_task._state:
             return
-        if not my_task._is_finished():
-            self._predict_hook(my_task)
+        static = self._predict_branch(my_task, set(), looked_ahead)
+        if static and not my_task._is_definite():
+            my_task._prediction_state = my_task._state
+
+    def _predict_branch(self, my_task, seen, looked_ahead):
+        """
+        Implements _predict(). The given set is shared along the whole
+        walk; each spec is removed again when its branch is done.
+
+        :rtype:  boolean
+        :returns: True if all predictions in the branch were static.
+        """
+        if my_task._is_finished() or self in seen:
+            return True
+        if looked_ahead > 0 and not my_task._is_definite() \
+          and my_task.workflow.prediction != Task.PREDICT_ALL:
+            return True
+        my_task._prediction_state = None
+        self._predict_hook(my_task)
+        static = self._has_static_prediction()
         if not my_task._is_definite():
             if looked_ahead + 1 >= self.lookahead:
-                return
-            seen.append(self)
+                return static
+            seen.add(self)
         for child in my_task.children:
-            child.task_spec._predict(child, seen[:], looked_ahead + 1)
+            if not child.task_spec._predict_branch(child, seen,
+                                                   looked_ahead + 1):
+                static = False
+        seen.discard(self)
+        return static
+
+    def _has_static_prediction(self):
+        """
+        Returns True if _predict_hook() only depends on this spec and on
+        the state, the children and the attributes of the task, such that
+        predicting an unchanged branch again has no effect. Specs that
+        overwrite _predict_hook() must also overwrite this method to
+        have their predictions remembered.
+
+        :rtype:  boolean
+        :returns: True if the prediction may be remembered.
+        """
+        hook = getattr(self._predict_hook, 'im_func', None)
+        return hook is TaskSpec._predict_hook.im_func
+
+    def _counts_tokens(self):
+        """
+        Returns True if the workflow should keep track of the tasks of this
+        spec that hold a token, i.e. that are not finished while their
+        parent is; see L{SpiffWorkflow.Workflow._get_tokens()}.
+
+        :rtype:  boolean
+        :returns: True if the tokens are counted.
+        """
+        return False
 
     def _predict_hook(self, my_task):
         # If the task's status is not predicted, we default to FUTURE
@@ -383,6 +544,13 @@ class TaskSpec(object):
         if my_task.workflow.debug:
             print "Executing task:", my_task.get_name()
 
+        prepared = my_task._prepared
+        if prepared:
+            my_task._prepared = False
+            if prepared is not True:
+                raise prepared
+        else:
+            self._prepare_hook(my_task)
         self._on_complete_hook(my_task)
 
         # Notify the Workflow.
@@ -395,6 +563,39 @@ class TaskSpec(object):
         self.completed_event.emit(my_task.workflow, my_task)
         return True
 
+    def _prepare(self, my_task):
+        """
+        Runs _prepare_hook() ahead of completing the given READY task.
+        The hook is then skipped when the task is completed. If the hook
+        fails, the exception is raised when the task is completed instead,
+        without its original traceback.
+        Should not be overwritten, overwrite _prepare_hook() instead.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        """
+        if my_task._prepared:
+            return
+        try:
+            self._prepare_hook(my_task)
+        except Exception, e:
+            my_task._prepared = e
+        else:
+            my_task._prepared = True
+
+    def _prepare_hook(self, my_task):
+        """
+        A hook into _on_complete() that does the part of the work that
+        only involves the task itself, such as running a script. It runs
+        before _on_complete_hook(), or ahead of time in a worker thread,
+        in parallel with other tasks. It must therefore not change the
+        state of any task, nor look at any task but the given one.
+
+        :type  my_task: Task
+        :param my_task: The associated task in the task tree.
+        """
+        pass
+
     def _on_complete_hook(self, my_task):
         """
         A hook into _on_complete() that does the task specific work.
@@ -124,6 +124,9 @@ class ThreadSplit(TaskSpec):
         else:
             my_task._sync_children(outputs, Task.LIKELY)
 
+    def _has_static_prediction(self):
+        return True
+
     def _on_complete_hook(self, my_task):
         # Split, and remember the number of splits in the context data.
         split_n = self.times
@@ -51,18 +51,22 @@ class Trigger(TaskSpec):
         self.times   = times
         self.queued  = 0
 
+    def _referenced_task_specs(self):
+        specs = [self._parent.get_task_spec_from_name(name)
+                 for name in self.context]
+        return [self] + specs
+
     def _on_trigger(self, my_task):
         """
         Enqueue a trigger, such that this tasks triggers multiple times later
         when _on_complete() is called.
         """
-        self.queued += 1
+        self._set_queued(my_task, self._get_queued(my_task) + 1)
         # All tasks that have already completed need to be put back to
         # READY.
-        for thetask in my_task.workflow.task_tree:
-            if thetask.thread_id != my_task.thread_id:
-                continue
-            if thetask.task_spec == self and thetask._has_state(Task.COMPLETED):
+        for thetask in my_task.workflow._get_thread_tasks(my_task.thread_id,
+                                                          self):
+            if thetask._has_state(Task.COMPLETED):
                 thetask._set_state(Task.FUTURE, True)
                 thetask._ready()
 
@@ -75,12 +79,44 @@ class Trigger(TaskSpec):
         :rtype:  bool
         :returns: True on success, False otherwise.
         """
-        for i in range(self.times + self.queued):
+        for i in range(self.times + self._get_queued(my_task)):
             for task_name in self.context:
                 task = my_task.workflow.get_task_spec_from_name(task_name)
                 task._on_trigger(my_task)
-        self.queued = 0
+        self._set_queued(my_task, 0)
         TaskSpec._on_complete_hook(self, my_task)
 
+    def _get_queued(self, my_task):
+        """
+        Returns the number of triggers that are queued for this task spec.
+        They are counted by the task spec itself, unless it is frozen; a
+        frozen task spec counts them in the internal attributes of the
+        root task of the workflow instead.
+        """
+        if not self.is_frozen():
+            return self.queued
+        root = my_task.workflow.task_tree
+        return root._get_internal_attribute(self._get_queue_key(), 0)
+
+    def _set_queued(self, my_task, queued):
+        """
+        Sets the number of queued triggers, see _get_queued().
+        """
+        if not self.is_frozen():
+            self.queued = queued
+            return
+        root = my_task.workflow.task_tree
+        if queued:
+            root.internal_attributes[self._get_queue_key()] = queued
+        else:
+            root.internal_attributes.pop(self._get_queue_key(), None)
+
+    def _get_queue_key(self):
+        """
+        The key under which a frozen task spec counts the queued triggers
+        in the internal attributes of the root task.
+        """
+        return 'queued_triggers:' + self.name
+
     def serialize(self, serializer):
         return serializer._serialize_trigger(self)
@@ -15,7 +15,10 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
 import logging
 
+from SpiffWorkflow.exceptions import WorkflowException
 from SpiffWorkflow.specs import StartTask
+from SpiffWorkflow.specs.SpecGraph import SpecGraph
+from SpiffWorkflow.util.impl import FrozenDict
 
 LOG = logging.getLogger(__name__)
 
@@ -33,16 +36,98 @@ class WorkflowSpec(object):
         self.description = ''
         self.file = filename
         self.task_specs = dict()
+        self._graph = None
         self.start = StartTask(self)
 
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            msg = 'Workflow spec is frozen, can not set %s' % name
+            raise WorkflowException(self, msg)
+        object.__setattr__(self, name, value)
+
     def _add_notify(self, task_spec):
         """
         Called by a task spec when it was added into the workflow.
         """
+        if self.is_frozen():
+            raise WorkflowException(self, 'Workflow spec is frozen.')
         if task_spec.name in self.task_specs:
             raise KeyError('Duplicate task spec name: ' + task_spec.name)
         self.task_specs[task_spec.name] = task_spec
         task_spec.id = len(self.task_specs)
+        self._graph = None
+
+    def _connect_notify(self, task_spec):
+        """
+        Called by a task spec when an input was connected to it.
+        """
+        self._graph = None
+
+    def compile(self):
+        """
+        Analyzes the graph of the task specs, such as which task specs
+        can be reached from which other ones. The result is used by the
+        task specs at runtime. It is computed when it is first needed,
+        and computed again after task specs were added or connected;
+        this method only needs to be called after the inputs or outputs
+        of a task spec were changed directly.
+
+        :rtype:  SpecGraph
+        :returns: The analysis of the graph.
+        """
+        self._graph = SpecGraph(self)
+        return self._graph
+
+    def _get_graph(self):
+        """
+        Returns the analysis of the graph, see compile().
+        """
+        graph = getattr(self, '_graph', None)
+        if graph is None:
+            graph = self.compile()
+        return graph
+
+    def freeze(self):
+        """
+        Compiles the spec and makes it read-only, including all of its task
+        specs and the specs of its sub workflows. Afterwards, task specs
+        can no longer be added or connected, and their attributes and
+        properties can not be changed; all state of a running workflow is
+        kept in its tasks. A frozen spec can be shared by any number of
+        workflows, including workflows that run in other threads, or in
+        processes that were forked after the spec was frozen.
+
+        Listeners may still be connected to the events of the task specs.
+        Freezing a spec that is already frozen does nothing.
+
+        :rtype:  SpecGraph
+        :returns: The analysis of the graph, see compile().
+        """
+        if self.is_frozen():
+            return self._graph
+        # Workflows add the spec of their root task if it is missing.
+        from SpiffWorkflow.specs import Simple
+        if 'Root' not in self.task_specs:
+            Simple(self, 'Root')
+        graph = self.compile()
+        for task_spec in graph.task_specs:
+            task_spec._freeze()
+        self.task_specs = FrozenDict(self.task_specs)
+        self._frozen = True
+        for task_spec in graph.task_specs:
+            sub_spec = getattr(task_spec, 'spec', None)
+            if isinstance(sub_spec, WorkflowSpec):
+                sub_spec.freeze()
+        return graph
+
+    def is_frozen(self):
+        """
+        Returns True if the spec was frozen by freeze().
+
+        :rtype:  boolean
+        :returns: True if the spec is read-only.
+        """
+        return self.__dict__.get('_frozen', False)
 
     def get_task_spec_from_name(self, name):
         """
@@ -59,34 +144,26 @@ class WorkflowSpec(object):
         """Checks integrity of workflow and reports any problems with it.
 
         Detects:
-        - loops (tasks that wait on each other in a loop)
+        - loops through a Join (tasks that wait on each other in a loop).
+          One loop is reported for each Join that is part of a loop, even
+          if the Join is part of several loops, so that the number of
+          results stays linear in the size of the spec. Loops without a
+          Join are not reported, since no task in them waits for another
+          one (e.g. the arbitrary cycles pattern).
+        - disconnected tasks (tasks that have outputs, but no inputs)
         :returns: empty list if valid, a list of errors if not
         """
         results = []
         from SpiffWorkflow.specs import Join
 
-        def recursive_find_loop(task, history):
-            current = history[:]
-            current.append(task)
-            if isinstance(task, Join):
-                if task in history:
-                    msg = "Found loop with '%s': %s then '%s' again" % (
-                            task.name, '->'.join([p.name for p in history]),
-                            task.name)
-                    raise Exception(msg)
-                for predecessor in task.inputs:
-                    recursive_find_loop(predecessor, current)
-
-            for parent in task.inputs:
-                recursive_find_loop(parent, current)
+        # Check for cyclic waits
+        graph = self.compile()
+        is_join = lambda task: isinstance(task, Join)
+        for task, path in graph.find_cycles(is_join):
+            results.append("Found loop with '%s': %s then '%s' again" % (
+                    task.name, '->'.join([p.name for p in path]), task.name))
 
         for task_id, task in self.task_specs.iteritems():
-            # Check for cyclic waits
-            try:
-                recursive_find_loop(task, [])
-            except Exception as exc:
-                results.append(exc.__str__())
-
             # Check for disconnected tasks
             if not task.inputs and task.name not in ['Start', 'Root']:
                 if task.outputs:
@@ -140,7 +217,7 @@ class WorkflowSpec(object):
                     dump += indent + '-  IN: ' + ','.join(['%s (%s)' % (t.name, hex(id(t))) for t in task_spec.inputs]) + '\n'
                 if task_spec.outputs:
                     dump += indent + '- OUT: ' + ','.join(['%s (%s)' % (t.name, hex(id(t))) for t in task_spec.outputs]) + '\n'
-            sub_specs = ([task_spec.spec.start] if hasattr(task_spec, 'spec') else []) + task_spec.outputs
+            sub_specs = ([task_spec.spec.start] if hasattr(task_spec, 'spec') else []) + list(task_spec.outputs)
             for i, t in enumerate(sub_specs):
                 dump += indent + '   --> ' + recursive_dump(t,indent+('   |   ' if i+1 < len(sub_specs) else '       '))
             return dump
@@ -12,6 +12,7 @@ from MultiChoice import MultiChoice
 from MultiInstance import MultiInstance
 from ReleaseMutex import ReleaseMutex
 from Simple import Simple
+from SpecGraph import SpecGraph
 from StartTask import StartTask
 from SubWorkflow import SubWorkflow
 from ThreadMerge import ThreadMerge
@@ -457,6 +457,8 @@ class DictionarySerializer(Serializer):
 
         # task_tree
         workflow.task_tree = self._deserialize_task(workflow, s_state['task_tree'])
+        workflow.task_tree._update_ancestry()
+        workflow._rebuild_task_map()
 
         return workflow
 
@@ -488,14 +490,14 @@ class DictionarySerializer(Serializer):
         s_state['last_state_change'] = task.last_state_change
 
         # attributes
-        s_state['attributes'] = task.attributes
+        s_state['attributes'] = task._peek_attributes()
 
         # internal_attributes
         s_state['internal_attributes'] = task.internal_attributes
 
         return s_state
 
-    def _deserialize_task(self, workflow, s_state):
+    def _deserialize_task(self, workflow, s_state, parent=None):
         assert isinstance(workflow, Workflow)
         # task_spec
         task_spec = workflow.get_task_spec_from_name(s_state['task_spec'])
@@ -505,13 +507,15 @@ class DictionarySerializer(Serializer):
         task.id = s_state['id']
 
         # parent
-        task.parent = workflow.get_task(s_state['parent'])
+        task.parent = parent
 
         # children
-        task.children = [self._deserialize_task(workflow, c) for c in s_state['children']]
+        task.children = [self._deserialize_task(workflow, c, task)
+                         for c in s_state['children']]
 
         # state
         task._state = s_state['state']
+        task._recount_children()
         task.triggered = s_state['triggered']
 
         # last_state_change
@@ -19,3 +19,18 @@ def get_class(full_class_name):
     class_name = parts[1]
     __import__(module_name)
     return getattr(sys.modules[module_name], class_name)
+
+
+class FrozenDict(dict):
+    """
+    A dictionary that can not be changed after it was created.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('%s is read-only' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
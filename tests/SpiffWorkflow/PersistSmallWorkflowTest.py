@@ -85,6 +85,8 @@ class PersistSmallWorkflowTest(unittest.TestCase):
         self.assertEqual(new_workflow.spec.start.get_property('marker'), old_workflow.spec.start.get_property('marker'))
         self.assertEqual(1, len([t for t in new_workflow.get_tasks() if t.task_spec.name == 'Start']))
         self.assertEqual(1, len([t for t in new_workflow.get_tasks() if t.task_spec.name == 'Root']))
+        for task in new_workflow.get_tasks():
+            self.assertTrue(new_workflow.get_task(task.id) is task)
 
 
 def suite():
@@ -0,0 +1,85 @@
+"""
+Compares the state queries of a workflow with a large MultiInstance
+fan-out, as answered by a walk of the task tree, by the default index
+with one set per state, and by a TaskArray with and without NumPy.
+
+Usage: python TaskArrayBenchmark.py [number of instances]
+"""
+import sys, os, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import SpiffWorkflow.TaskArray as task_array_module
+from SpiffWorkflow import Workflow, Task
+from SpiffWorkflow.specs import *
+
+def create_workflow(times, **kwargs):
+    wf_spec = WorkflowSpec()
+    fan_out = MultiInstance(wf_spec, 'fan_out', times = times)
+    wf_spec.start.connect(fan_out)
+    fan_out.connect(Simple(wf_spec, 'work'))
+    workflow = Workflow(wf_spec, history = Task.HISTORY_NONE, **kwargs)
+    workflow.complete_next()
+    workflow.complete_next()
+    return workflow
+
+def measure(func, repeat = 5):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def get_index_size(workflow):
+    if workflow._task_array is None:
+        size = sys.getsizeof(workflow._tasks_by_state)
+        for bucket in workflow._tasks_by_state.itervalues():
+            size += sys.getsizeof(bucket)
+        return size
+    task_array = workflow._task_array
+    return sys.getsizeof(task_array.states) \
+         + sys.getsizeof(task_array.tasks) \
+         + sys.getsizeof(task_array._free_slots)
+
+def run(times):
+    masks = [('READY', Task.READY),
+             ('COMPLETED', Task.COMPLETED),
+             ('NOT_FINISHED', Task.NOT_FINISHED_MASK)]
+    have_numpy = task_array_module.have_numpy
+    variants = [('tree walk', {}, None),
+                ('state sets', {}, None),
+                ('array', {'task_array': True}, False)]
+    if have_numpy:
+        variants.append(('array+numpy', {'task_array': True}, True))
+
+    print 'Instances: %d' % times
+    print '%-12s %10s %10s' % ('', 'create', 'index KB'),
+    for name, mask in masks:
+        print '%14s' % name,
+    print
+    for name, kwargs, use_numpy in variants:
+        if use_numpy is not None:
+            task_array_module.have_numpy = use_numpy
+        start    = time.time()
+        workflow = create_workflow(times, **kwargs)
+        created  = time.time() - start
+        print '%-12s %9.3fs %10d' % (name,
+                                     created,
+                                     get_index_size(workflow) / 1024),
+        for mask_name, mask in masks:
+            if name == 'tree walk':
+                func = lambda: len(list(Task.Iterator(workflow.task_tree,
+                                                      mask)))
+            else:
+                func = lambda: len(workflow._find_tasks(mask))
+            print '%13.4fs' % measure(func),
+        print
+    task_array_module.have_numpy = have_numpy
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        run(int(sys.argv[1]))
+    else:
+        run(100000)
@@ -9,6 +9,19 @@ from SpiffWorkflow.exceptions import WorkflowException
 class MockWorkflow(object):
     def __init__(self):
         self.task_id_assigner = TaskIdAssigner()
+        self.history = Task.HISTORY_LOG
+
+    def _task_added_notify(self, task):
+        pass
+
+    def _task_removed_notify(self, task):
+        pass
+
+    def _task_state_changed_notify(self, task, old_state):
+        pass
+
+    def _task_thread_changed_notify(self, task, old_thread_id):
+        pass
 
 class TaskTest(unittest.TestCase):
     def setUp(self):
@@ -69,6 +82,177 @@ class TaskTest(unittest.TestCase):
                      'Expected:\n' + expected2 + '\n' + \
                      'but got:\n'  + result)
 
+    def testIteratorWideTree(self):
+        spec     = WorkflowSpec()
+        workflow = MockWorkflow()
+        task_spec = Simple(spec, 'Simple')
+        root     = Task(workflow, task_spec)
+        children = [root._add_child(task_spec) for i in range(2000)]
+        likely   = children[10]._add_child(task_spec, Task.LIKELY)
+        likely._add_child(task_spec, Task.LIKELY)
+        children[20]._add_child(task_spec)
+
+        # LIKELY subtrees are only entered when LIKELY is searched for.
+        result = [t for t in Task.Iterator(root, Task.MAYBE)]
+        self.assertEqual(len(result), 2002)
+        self.assertEqual(result[:12], [root] + children[:11])
+        result = [t for t in Task.Iterator(root, Task.LIKELY)]
+        self.assertEqual(len(result), 2)
+        result = [t for t in Task.Iterator(root)]
+        self.assertEqual(len(result), 2004)
+        self.assertEqual(result[-1], children[-1])
+
+    def testSubtreeMask(self):
+        spec      = WorkflowSpec()
+        workflow  = MockWorkflow()
+        task_spec = Simple(spec, 'Simple')
+        root      = Task(workflow, task_spec, state = Task.COMPLETED)
+        c1        = root._add_child(task_spec, Task.COMPLETED)
+        c2        = root._add_child(task_spec, Task.FUTURE)
+        c11       = Task(workflow, task_spec, c1, Task.READY)
+        self.assertEqual(root._subtree_mask,
+                         Task.COMPLETED | Task.FUTURE | Task.READY)
+        self.assertEqual(c1._subtree_mask, Task.COMPLETED | Task.READY)
+
+        c11.state = Task.COMPLETED
+        self.assertEqual(c1._subtree_mask, Task.COMPLETED)
+        self.assertEqual(root._subtree_mask, Task.COMPLETED | Task.FUTURE)
+        c2.state = Task.READY
+        self.assertEqual(root._subtree_mask, Task.COMPLETED | Task.READY)
+        self.assertEqual([t for t in Task.Iterator(root, Task.READY)], [c2])
+
+        root._remove_child(c2)
+        self.assertEqual(root._subtree_mask, Task.COMPLETED)
+        self.assertEqual([t for t in Task.Iterator(root, Task.READY)], [])
+
+        # Detached branches no longer affect their former parent.
+        c2.state = Task.COMPLETED
+        Task(workflow, task_spec, c2, Task.WAITING)
+        self.assertEqual(root._subtree_mask, Task.COMPLETED)
+
+    def testAncestors(self):
+        spec      = WorkflowSpec()
+        workflow  = MockWorkflow()
+        task_spec = Simple(spec, 'Simple')
+        marker    = Simple(spec, 'Marker')
+        root      = Task(workflow, task_spec)
+
+        # Deeper than the recursion limit.
+        chain = [root]
+        for i in range(3000):
+            if i == 1000:
+                chain.append(Task(workflow, marker, chain[-1]))
+            else:
+                chain.append(Task(workflow, task_spec, chain[-1]))
+        leaf = chain[-1]
+        self.assertEqual(leaf._get_depth(), 3000)
+        self.assert_(leaf._get_root() is root)
+        for depth in (0, 1, 2, 999, 1001, 2047, 2999):
+            self.assert_(leaf._get_ancestor_at_depth(depth) is chain[depth])
+            self.assert_(leaf._is_descendant_of(chain[depth]))
+            self.failIf(chain[depth]._is_descendant_of(leaf))
+        self.failIf(leaf._is_descendant_of(leaf))
+        self.assert_(leaf._find_ancestor(marker) is chain[1001])
+        self.assert_(leaf._find_ancestor_from_name('Marker') is chain[1001])
+        self.assert_(leaf._find_child_of(marker) is chain[1002])
+        self.assert_(leaf._find_ancestor(Simple(spec, 'Missing')) is root)
+        self.assertEqual(leaf._find_ancestor_from_name('Missing'), None)
+
+        # The lookup skips the ancestors whose task specs do not match.
+        visited = []
+        def matches(task):
+            visited.append(task)
+            return task.task_spec == marker
+        found = leaf._find_closest_ancestor('Marker', matches)
+        self.assert_(found is chain[1001])
+        self.assert_(len(visited) < 100)
+
+        # Moving a branch updates the depths below it.
+        other = Task(workflow, task_spec)
+        child = Task(workflow, task_spec, other)
+        grandchild = Task(workflow, task_spec, child)
+        chain[10]._insert_child(0, child)
+        self.assertEqual(grandchild._get_depth(), 12)
+        self.assert_(grandchild._get_root() is root)
+        self.assert_(grandchild._is_descendant_of(chain[5]))
+        self.failIf(grandchild._is_descendant_of(other))
+        self.assert_(grandchild._find_ancestor(marker) is root)
+        chain[2000]._insert_child(0, child)
+        self.assert_(grandchild._find_ancestor(marker) is chain[1001])
+
+    def testCancel(self):
+        spec      = WorkflowSpec()
+        workflow  = MockWorkflow()
+        task_spec = Simple(spec, 'Simple')
+        cancelled = []
+        task_spec.cancelled_event.connect(
+            lambda workflow, task: cancelled.append(task))
+        root      = Task(workflow, task_spec, state = Task.COMPLETED)
+        done      = Task(workflow, task_spec, root, Task.COMPLETED)
+        waiting   = [Task(workflow, task_spec, done, Task.WAITING)
+                     for i in range(5000)]
+        for task in waiting:
+            Task(workflow, task_spec, task, Task.FUTURE)
+
+        # Unfinished tasks below finished ones are cancelled, and
+        # their unfinished children are removed.
+        root.cancel()
+        self.assertEqual(cancelled, waiting)
+        self.assertEqual(done.children, waiting)
+        for task in waiting:
+            self.assertEqual(task.state, Task.CANCELLED)
+            self.assertEqual(task.children, [])
+        self.assertEqual(root._subtree_mask, Task.COMPLETED | Task.CANCELLED)
+
+    def testSyncChildren(self):
+        spec     = WorkflowSpec()
+        workflow = MockWorkflow()
+        spec_a   = Simple(spec, 'A')
+        spec_b   = Simple(spec, 'B')
+        spec_c   = Simple(spec, 'C')
+        root     = Task(workflow, spec_a)
+
+        # 10k identical outputs, as created by MultiInstance or ThreadSplit.
+        root._sync_children([spec_a] * 10000 + [spec_b])
+        self.assertEqual(len(root.children), 10001)
+        children = root.children[:]
+        root._sync_children([spec_c] + [spec_a] * 9000)
+        self.assertEqual(root.children[:9000], children[:9000])
+        self.assertEqual([c.task_spec for c in root.children[9000:]],
+                         [spec_c])
+
+        # Triggered children are kept, definite ones may not be removed.
+        root.children[0].triggered = True
+        root.children[1].state = Task.FUTURE
+        root._sync_children([spec_a])
+        self.assertEqual(len(root.children), 2)
+        self.assertRaises(WorkflowException, root._sync_children, [])
+
+    def testInheritAttributes(self):
+        spec     = WorkflowSpec()
+        workflow = MockWorkflow()
+        root     = Task(workflow, Simple(spec, 'Simple 1'))
+        child1   = root._add_child(Simple(spec, 'Simple 2'))
+        child2   = root._add_child(Simple(spec, 'Simple 3'))
+        root.set_attribute(a = 1, b = 2)
+        child1._inherit_attributes()
+        child2.set_attribute(c = 3)
+        child2._inherit_attributes()
+        self.assertEqual(child1.get_attributes(), {'a': 1, 'b': 2})
+        self.assertEqual(child2.get_attributes(), {'a': 1, 'b': 2, 'c': 3})
+
+        # Writes on either side must not be visible on the other.
+        grandchild = child1._add_child(Simple(spec, 'Simple 4'))
+        grandchild._inherit_attributes()
+        root.set_attribute(a = 10)
+        child1.set_attribute(b = 20)
+        grandchild.attributes['c'] = 30
+        self.assertEqual(root.get_attributes(), {'a': 10, 'b': 2})
+        self.assertEqual(child1.get_attributes(), {'a': 1, 'b': 20})
+        self.assertEqual(grandchild.get_attributes(),
+                         {'a': 1, 'b': 2, 'c': 30})
+        self.assertEqual(grandchild.get_attribute('a'), 1)
+
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TaskTest)
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+import sys, unittest, os, shutil, tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from SpiffWorkflow import Workflow, WorkflowRunner
+from SpiffWorkflow.specs import WorkflowSpec, Simple, Execute, Join
+from SpiffWorkflow.Task import Task
+
+# Leaves a mark in the given directory, then waits until the given number
+# of marks exist. Exits with 0 if they all exist, or with 1 if they did
+# not within ten seconds.
+RENDEZVOUS = '''
+import os, sys, time
+dirname, count = sys.argv[1], int(sys.argv[2])
+open(os.path.join(dirname, str(os.getpid())), 'w').close()
+deadline = time.time() + 10
+while len(os.listdir(dirname)) < count:
+    if time.time() > deadline:
+        sys.exit(1)
+    time.sleep(0.01)
+'''
+
+class WorkflowRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def create_spec(self, count):
+        # Two processes that run in parallel, followed by a join. The
+        # processes only exit once the given number of processes started.
+        wf_spec = WorkflowSpec()
+        args = [sys.executable, '-c', RENDEZVOUS, self.dirname, str(count)]
+        join = Join(wf_spec, 'join')
+        for name in ('exec1', 'exec2'):
+            task_spec = Execute(wf_spec, name, args = args)
+            wf_spec.start.connect(task_spec)
+            task_spec.connect(join)
+        join.connect(Simple(wf_spec, 'last'))
+
+        # Count how often the processes are checked.
+        self.checks = 0
+        def count_checks(my_task, force = False):
+            self.checks += 1
+            return Execute._try_fire(my_task.task_spec, my_task, force)
+        for name in ('exec1', 'exec2'):
+            wf_spec.get_task_spec_from_name(name)._try_fire = count_checks
+        return wf_spec
+
+    def testRun(self):
+        # The processes of all workflows run at the same time, so each of
+        # them sees all the others.
+        n_workflows = 5
+        wf_spec     = self.create_spec(2 * n_workflows)
+        runner      = WorkflowRunner()
+        workflows   = [Workflow(wf_spec) for i in range(n_workflows)]
+        for workflow in workflows:
+            runner.add(workflow)
+
+        self.assert_(runner.run())
+        for workflow in workflows:
+            self.assert_(workflow.is_completed())
+            for task in workflow.get_tasks():
+                if isinstance(task.task_spec, Execute):
+                    self.assertEqual(task.subprocess.returncode, 0)
+
+        # Each task is checked when it is reached, and once more when its
+        # process exited, but never polled.
+        self.assertEqual(self.checks, 2 * 2 * len(workflows))
+
+    def testTimeout(self):
+        # The processes wait for a third mark, which is only left after
+        # the runner timed out.
+        wf_spec  = self.create_spec(3)
+        runner   = WorkflowRunner()
+        workflow = Workflow(wf_spec)
+        runner.add(workflow)
+        self.failIf(runner.run(timeout = 0.05))
+        self.failIf(workflow.is_completed())
+        open(os.path.join(self.dirname, 'test'), 'w').close()
+        self.assert_(runner.run())
+        self.assert_(workflow.is_completed())
+
+    def testWaitHandleOwnsProcess(self):
+        wf_spec  = self.create_spec(2)
+        workflow = Workflow(wf_spec)
+        workflow.complete_next()
+        task     = workflow.get_tasks(Task.WAITING)[0]
+        handle   = task.task_spec._get_wait_handle(task)
+
+        # Once the handle was taken, only the handle reads from the process.
+        def poll():
+            self.fail('process polled while its wait handle owns it')
+        task.subprocess.poll = poll
+        task.task_spec._update_state(task)
+        self.assert_(task._has_state(Task.WAITING))
+
+        handle()
+        task.task_spec._update_state(task)
+        self.failIf(task._has_state(Task.WAITING))
+        self.assertEqual(task.subprocess.returncode, 0)
+        self.assertEqual(task.task_spec._get_wait_handle(task), None)
+
+        runner = WorkflowRunner()
+        runner.add(workflow)
+        self.assert_(runner.run())
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(WorkflowRunnerTest)
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity = 2).run(suite())
@@ -1,4 +1,4 @@
-import sys, unittest, re, os
+import sys, unittest, re, os, glob, pickle
 data_dir = os.path.join(os.path.dirname(__file__), 'data')
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
@@ -7,6 +7,8 @@ from SpiffWorkflow.specs import *
 from SpiffWorkflow.operators import *
 from SpiffWorkflow.Task import *
 from SpiffWorkflow.storage import XmlSerializer
+import SpiffWorkflow.TaskArray as task_array_module
+from util import track_workflow
 
 class WorkflowTest(unittest.TestCase):
     def testConstructor(self):
@@ -62,6 +64,390 @@ class WorkflowTest(unittest.TestCase):
         self.assertEqual(tasks[0].task_spec.name, 'synch_1')
         # haven't reached the end of the workflow, but stopping at "synch_1"
 
+    def testGetTask(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec)
+
+        for task in workflow.get_tasks():
+            self.assertTrue(workflow.get_task(task.id) is task)
+        self.assertEqual(workflow.get_task(-1), None)
+
+        # Tasks that are removed from the tree can no longer be found.
+        workflow.complete_all()
+        ids = [task.id for task in workflow.get_tasks()]
+        for id in range(1, workflow.task_id_assigner.id_pool + 1):
+            task = workflow.get_task(id)
+            if id in ids:
+                self.assertEqual(task.id, id)
+            else:
+                self.assertEqual(task, None)
+
+    def testGetTasks(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec)
+
+        # The result must match a full walk of the tree, in the same order.
+        masks = Task.state_names.keys() + [Task.ANY_MASK,
+                                           Task.NOT_FINISHED_MASK,
+                                           Task.READY | Task.WAITING]
+        while True:
+            for mask in masks:
+                expected = [t for t in Task.Iterator(workflow.task_tree, mask)]
+                self.assertEqual(workflow.get_tasks(mask), expected)
+                self.assertEqual(workflow.get_task_count(mask), len(expected))
+            if not workflow.complete_next():
+                break
+
+    def testGetThreadTasks(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec)
+
+        # The index must agree with a walk of the tree.
+        while True:
+            for task in workflow.task_tree:
+                expected = [t for t in workflow.task_tree
+                            if t.thread_id == task.thread_id
+                            and t.task_spec == task.task_spec]
+                result = workflow._get_thread_tasks(task.thread_id,
+                                                    task.task_spec)
+                self.assertEqual(result, expected)
+            if not workflow.complete_next():
+                break
+
+    def testCompact(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+
+        def run(compact):
+            workflow = Workflow(wf_spec)
+            archived = []
+            ready    = []
+            while True:
+                ready.append([t.get_name()
+                              for t in workflow.get_tasks(Task.READY)])
+                if compact:
+                    n_tasks = len(workflow.get_tasks())
+                    n_archived = workflow.compact(archived.append)
+                    self.assertEqual(len(workflow.get_tasks()),
+                                     n_tasks - n_archived)
+                if not workflow.complete_next():
+                    break
+            self.assert_(workflow.is_completed())
+            return ready, archived
+
+        # Compaction must not change the path that is taken.
+        expected, archived = run(False)
+        result, archived = run(True)
+        self.assertEqual(result, expected)
+        self.assertNotEqual(archived, [])
+        for task in archived:
+            self.assert_(task._is_finished())
+            self.assertEqual(task._subtree_mask & Task.NOT_FINISHED_MASK, 0)
+
+    def testCompactStructuredJoin(self):
+        # A structured join counts the branch that ends at 'B' as
+        # completed, so that branch must not be archived.
+        wf_spec = WorkflowSpec()
+        split   = MultiChoice(wf_spec, 'split')
+        wf_spec.start.connect(split)
+        join    = Join(wf_spec, 'join', split_task = 'split', threshold = 2)
+        for name in ('A', 'B', 'C'):
+            task_spec = Simple(wf_spec, name)
+            split.connect_if(Equal(1, 1), task_spec)
+            if name != 'B':
+                task_spec.connect(join)
+
+        def run(compact):
+            workflow = Workflow(wf_spec)
+            for name in ('Start', 'split', 'B', 'A'):
+                task = [t for t in workflow.get_tasks(Task.READY)
+                        if t.get_name() == name][0]
+                task.complete()
+                if compact:
+                    workflow.compact()
+            return sorted(t.get_name()
+                          for t in workflow.get_tasks(Task.READY))
+
+        self.assertEqual(run(False), ['C', 'join'])
+        self.assertEqual(run(True), ['C', 'join'])
+
+    def testLoadLegacyPickle(self):
+        # The pickle was made by a version in which tasks and workflows
+        # carried a plain __dict__, after completing three tasks.
+        pickle_file = os.path.join(data_dir, 'spiff', 'workflow1.pickle')
+        workflow    = pickle.loads(open(pickle_file).read())
+        xml_file    = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml         = open(xml_file).read()
+        wf_spec     = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        expected    = Workflow(wf_spec)
+        for i in range(3):
+            expected.complete_next()
+
+        def get_tasks(workflow):
+            return sorted((t.get_name(), t.state, t._get_depth())
+                          for t in workflow.get_tasks())
+        self.assertEqual(get_tasks(workflow), get_tasks(expected))
+        for task in workflow.get_tasks():
+            self.assertEqual(task.__dict__, {})
+            depth, parent = 0, task.parent
+            while parent is not None:
+                depth, parent = depth + 1, parent.parent
+            self.assertEqual(task._get_depth(), depth)
+
+        def run(workflow):
+            taken = []
+            while workflow.complete_next():
+                taken.append(workflow.last_task.get_name())
+            self.assert_(workflow.is_completed())
+            return taken
+        self.assertEqual(run(workflow), run(expected))
+
+    def testReadyQueue(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        workflow = Workflow(wf_spec, ready_queue = True)
+
+        # Tasks are completed in the order in which they became ready.
+        while True:
+            ready = workflow.get_tasks(Task.READY)
+            queued = [t for t in workflow._ready_queue
+                      if workflow._is_ready_in_tree(t)]
+            self.assertEqual(set(queued), set(ready))
+            if not workflow.complete_next(False):
+                break
+            if ready:
+                self.assert_(workflow.last_task is queued[0])
+        self.assert_(workflow.is_completed())
+        self.assertEqual(workflow.get_tasks(Task.READY), [])
+
+    def testTaskArray(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+
+        # The queries give the same results as with one set per state,
+        # with and without NumPy.
+        def get_tasks(workflow):
+            result = []
+            for state in sorted(Task.state_names):
+                result.append([(t.id, t.get_name())
+                               for t in workflow.get_tasks(state)])
+                result.append(workflow.get_task_count(state))
+            return result
+        have_numpy = task_array_module.have_numpy
+        try:
+            for use_numpy in set([False, have_numpy]):
+                task_array_module.have_numpy = use_numpy
+                expected = Workflow(wf_spec)
+                workflow = Workflow(wf_spec, task_array = True)
+                self.assert_(workflow._tasks_by_state is None)
+                pickled  = False
+                while True:
+                    self.assertEqual(get_tasks(workflow), get_tasks(expected))
+                    if not expected.complete_next(False):
+                        break
+                    workflow.complete_next(False)
+                    if workflow.last_task.get_name() == 'task_c2':
+                        workflow = pickle.loads(pickle.dumps(workflow))
+                        workflow.compact()
+                        expected.compact()
+                        pickled = True
+                self.assert_(pickled)
+                self.assert_(workflow.is_completed())
+                self.assertEqual(len(workflow._task_array),
+                                 len(workflow._task_map))
+        finally:
+            task_array_module.have_numpy = have_numpy
+
+    def testCompleteSteps(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        expected = Workflow(wf_spec)
+        expected.complete_all()
+
+        # Interleaved runs take the same path as uninterrupted ones.
+        workflows = [Workflow(wf_spec) for i in range(3)]
+        running = workflows[:]
+        rounds = 0
+        while running:
+            rounds += 1
+            for workflow in running[:]:
+                if not workflow.complete_steps(max_steps = 2):
+                    running.remove(workflow)
+        self.assert_(rounds > 2)
+        for workflow in workflows:
+            self.assert_(workflow.is_completed())
+            self.assertEqual(workflow.task_tree.get_dump(),
+                             expected.task_tree.get_dump())
+
+        # A timeout still allows for one step per call.
+        workflow = Workflow(wf_spec)
+        self.assert_(workflow.complete_steps(timeout = 0))
+        self.assertEqual(workflow.get_task_count(Task.COMPLETED), 2)
+
+    def testWakeWaitingTasks(self):
+        wf_spec = WorkflowSpec()
+        task_a  = Simple(wf_spec, 'task_a')
+        task_b  = Simple(wf_spec, 'task_b')
+        task_c  = Simple(wf_spec, 'task_c')
+        task_d  = Simple(wf_spec, 'task_d')
+        join    = Join(wf_spec, 'join')
+        gate    = Gate(wf_spec, 'gate', 'task_b')
+        for task_spec in (task_a, task_b, task_c, task_d):
+            wf_spec.start.connect(task_spec)
+        task_a.connect(join)
+        task_b.connect(join)
+        task_c.connect(gate)
+        workflow = Workflow(wf_spec)
+
+        # Record which tasks are re-evaluated.
+        updated = []
+        def record(task_spec):
+            hook = task_spec._update_state_hook
+            def update_state_hook(my_task):
+                updated.append(my_task.get_name())
+                hook(my_task)
+            task_spec._update_state_hook = update_state_hook
+        record(join)
+        record(gate)
+
+        def complete(name):
+            for task in workflow.get_tasks(Task.READY):
+                if task.get_name() == name:
+                    return workflow.complete_task_from_id(task.id)
+            self.fail('%s is not ready' % name)
+        for name in ('Start', 'task_a', 'task_c'):
+            complete(name)
+        self.assertEqual(sorted(t.get_name()
+                                for t in workflow.get_tasks(Task.WAITING)),
+                         ['gate', 'join'])
+
+        # Unrelated completions do not touch the waiting tasks.
+        del updated[:]
+        complete('task_d')
+        self.assertEqual(updated, [])
+        complete('task_b')
+        self.assert_('gate' in updated)
+        self.assertEqual(sorted(t.get_name()
+                                for t in workflow.get_tasks(Task.READY)),
+                         ['gate', 'join'])
+
+    def testWakeCompletedInputs(self):
+        # A Join completes the inputs that it merges without calling
+        # Task.complete(), and a WAITING join that depends on them must
+        # be woken as if every WAITING task were updated.
+        class RefreshingWorkflow(Workflow):
+            def _wake_waiting_tasks(self):
+                for task in self._get_waiting_tasks():
+                    task.task_spec._update_state(task)
+
+        def run(xml_file, workflow_class):
+            Task.id_pool = 0
+            xml      = open(xml_file).read()
+            wf_spec  = WorkflowSpec.deserialize(XmlSerializer(),
+                                                xml,
+                                                filename = xml_file)
+            workflow = workflow_class(wf_spec)
+            steps    = []
+            while True:
+                steps.append([(t.id, t.get_name(), t.state)
+                              for t in workflow.get_tasks()])
+                if not workflow.complete_next(False):
+                    break
+            self.assert_(workflow.is_completed(), xml_file)
+            return steps
+
+        pattern_dir = os.path.join(data_dir, 'spiff', 'control-flow')
+        for name in ('static_partial_join_for_multi_instance',
+                     'dynamic_partial_join_for_multi_instance',
+                     'cancelling_partial_join_for_multi_instance',
+                     'multi_instance_without_a_priori'):
+            xml_file = os.path.join(pattern_dir, name + '.xml')
+            expected = run(xml_file, RefreshingWorkflow)
+            steps    = run(xml_file, Workflow)
+            self.assertEqual(len(steps), len(expected), xml_file)
+            for n, (step, expected_step) in enumerate(zip(steps, expected)):
+                self.assertEqual(step, expected_step, '%s step %d' % (name, n))
+
+    def testPredictDefinite(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+        expected = Workflow(wf_spec)
+        workflow = Workflow(wf_spec, prediction = Task.PREDICT_DEFINITE)
+        predicted = Task.LIKELY | Task.MAYBE
+        self.assert_(workflow.get_task_count(predicted)
+                     < expected.get_task_count(predicted))
+
+        # A forecast adds the same tasks as a full prediction.
+        def get_tasks(workflow):
+            return sorted((t.get_name(), t.state, t._get_depth())
+                          for t in workflow.get_tasks())
+        workflow.predict()
+        self.assertEqual(get_tasks(workflow), get_tasks(expected))
+
+        # The path that is taken does not change.
+        workflow = Workflow(wf_spec, prediction = Task.PREDICT_DEFINITE)
+        expected.complete_all()
+        workflow.complete_all()
+        self.assert_(workflow.is_completed())
+        self.assertEqual([t.get_name() for t in workflow.get_tasks()],
+                         [t.get_name() for t in expected.get_tasks()])
+
+    def testPredictDefinitePatterns(self):
+        def run(xml_file, prediction):
+            xml      = open(xml_file).read()
+            wf_spec  = WorkflowSpec.deserialize(XmlSerializer(),
+                                                xml,
+                                                filename = xml_file)
+            path     = track_workflow(wf_spec)
+            workflow = Workflow(wf_spec, prediction = prediction)
+            for i in range(10):
+                workflow.complete_all(False)
+                if workflow.is_completed():
+                    break
+            self.assert_(workflow.is_completed(), xml_file)
+            return path
+
+        pattern_dir = os.path.join(data_dir, 'spiff', 'control-flow')
+        for xml_file in sorted(glob.glob(os.path.join(pattern_dir, '*.xml'))):
+            expected = run(xml_file, Task.PREDICT_ALL)
+            taken    = run(xml_file, Task.PREDICT_DEFINITE)
+            self.assertEqual(taken, expected, xml_file)
+
+    def testHistory(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml      = open(xml_file).read()
+        wf_spec  = WorkflowSpec.deserialize(XmlSerializer(), xml)
+
+        workflow = Workflow(wf_spec, history = Task.HISTORY_NONE)
+        workflow.complete_all()
+        for task in workflow.get_tasks():
+            self.assertEqual(task.state_history, [task.state])
+            self.assertEqual(task.log, [])
+
+        workflow = Workflow(wf_spec, history = Task.HISTORY_STATES)
+        workflow.complete_all()
+        for task in workflow.get_tasks(Task.COMPLETED):
+            self.assertEqual(task.state_history[-1], Task.COMPLETED)
+            self.assert_(len(task.state_history) > 1)
+            self.assertEqual(task.log, [])
+
+        workflow = Workflow(wf_spec, history = Task.HISTORY_LOG)
+        workflow.complete_all()
+        for task in workflow.get_tasks(Task.COMPLETED):
+            self.assert_(len(task.state_history) > 1)
+            self.assertEqual(len(task.log), len(task.state_history) - 1)
+
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(WorkflowTest)
 if __name__ == '__main__':
@@ -0,0 +1,58 @@
+import unittest
+from SpiffWorkflow.bpmn.BpmnWorkflowHost import BpmnWorkflowHost, RemoteWorkflowException
+from tests.SpiffWorkflow.bpmn.BpmnWorkflowTestCase import BpmnWorkflowTestCase
+
+__author__ = 'matth'
+
+
+class BpmnWorkflowHostTest(BpmnWorkflowTestCase):
+    def setUp(self):
+        self.spec = self.load_workflow_spec('Test-Workflows/*.bpmn20.xml', 'Nested Subprocesses')
+        self.host = BpmnWorkflowHost({'nested': self.spec}, processes=3)
+        self.host.start()
+
+    def tearDown(self):
+        self.host.close()
+
+    def testRunThroughHappy(self):
+        instance_ids = ['instance-%d' % i for i in range(10)]
+        for instance_id in instance_ids:
+            status = self.host.start_workflow(instance_id, 'nested')
+            self.assertEquals(['Action1'], status['ready_user_tasks'])
+        self.assertEquals(sorted(instance_ids), sorted(self.host.get_instance_ids()))
+        self.assertTrue(len(set(self.host.get_shard(i) for i in instance_ids)) > 1)
+
+        for instance_id in instance_ids:
+            self.host.complete_task(instance_id, 'Action1')
+            self.host.complete_task(instance_id, 'Action2')
+            status = self.host.complete_task(instance_id, 'Action3')
+            self.assertTrue(status['completed'])
+            self.assertEquals([], status['ready_user_tasks'] + status['waiting_tasks'])
+
+        self.assertRaises(RemoteWorkflowException, self.host.complete_task, instance_ids[0], 'Action1')
+        self.assertRaises(RemoteWorkflowException, self.host.get_status, 'unknown')
+
+    def testSpecsNotFrozen(self):
+        # The workers use a frozen copy of the specs.
+        self.assertFalse(self.spec.is_frozen())
+        status = self.host.start_workflow('a', 'nested')
+        self.assertEquals(['Action1'], status['ready_user_tasks'])
+
+    def testSaveLoad(self):
+        self.host.start_workflow('a', 'nested')
+        self.host.complete_task('a', 'Action1')
+        spec_name, state = self.host.save_workflow('a')
+        self.host.remove_workflow('a')
+        self.assertEquals([], self.host.get_instance_ids())
+
+        # The instance may be restored under another id, in another process.
+        status = self.host.load_workflow('b', spec_name, state)
+        self.assertEquals(['Action2'], status['ready_user_tasks'])
+        self.host.complete_task('b', 'Action2')
+        status = self.host.complete_task('b', 'Action3')
+        self.assertTrue(status['completed'])
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(BpmnWorkflowHostTest)
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity = 2).run(suite())
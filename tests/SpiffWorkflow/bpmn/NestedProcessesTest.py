@@ -31,6 +31,21 @@ class NestedProcessesTest(BpmnWorkflowTestCase):
         self.save_restore()
         self.assertEquals(0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
 
+    def testRunThroughBudgeted(self):
+
+        self.workflow = BpmnWorkflow(self.spec)
+        self.assertTrue(self.workflow.do_engine_steps(max_steps=1))
+        while self.workflow.do_engine_steps(max_steps=1):
+            pass
+        for name in ('Action1', 'Action2', 'Action3'):
+            self.assertEquals([name], [t.task_spec.description for t in self.workflow.get_ready_user_tasks()])
+            self.workflow.get_ready_user_tasks()[0].complete()
+            steps = 0
+            while self.workflow.do_engine_steps(max_steps=1):
+                steps += 1
+            self.assertTrue(steps > 0)
+        self.assertEquals(0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
+
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(NestedProcessesTest)
 if __name__ == '__main__':
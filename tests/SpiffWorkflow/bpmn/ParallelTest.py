@@ -1,8 +1,16 @@
 import unittest
 import logging
 import sys
+import threading
+import pickle
+from multiprocessing.pool import ThreadPool
 from SpiffWorkflow.Task import Task
+from SpiffWorkflow.bpmn.BpmnScriptEngine import BpmnScriptEngine
 from SpiffWorkflow.bpmn.BpmnWorkflow import BpmnWorkflow
+from SpiffWorkflow.bpmn.specs.BpmnProcessSpec import BpmnProcessSpec
+from SpiffWorkflow.bpmn.specs.EndEvent import EndEvent
+from SpiffWorkflow.bpmn.specs.ParallelGateway import ParallelGateway
+from SpiffWorkflow.bpmn.specs.ScriptTask import ScriptTask
 from tests.SpiffWorkflow.bpmn.BpmnWorkflowTestCase import BpmnWorkflowTestCase
 
 __author__ = 'matth'
@@ -515,6 +523,36 @@ class ParallelMultipleSplitsAndJoinsTest(AbstractParallelTest):
         self._do_test(['1', '1B', '1A', '1 Done', '!Done', '2', '2B', '2A', '2 Done', 'Done'], save_restore=True)
 
 
+class ParallelTokensTest(BpmnWorkflowTestCase):
+    def setUp(self):
+        self.spec = self.load_workflow_spec('Test-Workflows/Parallel-Multiple-Splits-And-Joins.bpmn20.xml', 'Parallel Multiple Splits And Joins')
+
+    def assertTokensMatchTree(self):
+        # The tokens must agree with a walk of the tree.
+        expected = {}
+        for task in self.workflow.task_tree:
+            if not isinstance(task.task_spec, ParallelGateway) or task.workflow is not self.workflow:
+                continue
+            if task._is_finished() or not task.parent._is_finished():
+                continue
+            tokens = expected.setdefault((task.thread_id, task.task_spec), {})
+            tokens.setdefault(task.parent.task_spec, set()).add(task)
+        self.assertEquals(self.workflow._tokens, expected)
+
+    def testRunThrough(self):
+        self.workflow = BpmnWorkflow(self.spec)
+        self.workflow.do_engine_steps()
+        for step in ['1', '2', '1B', '2B', '1A', '2A', '1 Done', '2 Done', 'Done']:
+            self.assertTokensMatchTree()
+            self.do_next_named_step(step)
+            self.workflow.do_engine_steps()
+            self.assertTokensMatchTree()
+            self.save_restore()
+        self.assertTokensMatchTree()
+        self.assertEquals(self.workflow._tokens, {})
+        self.assertEquals(0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
+
+
 class ParallelLoopingAfterJoinTest(AbstractParallelTest):
     def setUp(self):
         self.spec = self.load_spec()
@@ -591,6 +629,162 @@ class ParallelManyThreadsAtSamePointTestNested(AbstractParallelTest):
         self._do_test(instructions, only_one_instance=False, save_restore=True)
 
 
+class _RendezvousScriptEngine(BpmnScriptEngine):
+    """
+    Offers a rendezvous() function to the scripts, which returns True
+    only if all scripts are running at the same time.
+    """
+    def __init__(self, count, timeout):
+        super(_RendezvousScriptEngine, self).__init__()
+        self.count = count
+        self.timeout = timeout
+        self.arrived = 0
+        self.lock = threading.Lock()
+        self.all_arrived = threading.Event()
+
+    def rendezvous(self):
+        with self.lock:
+            self.arrived += 1
+            if self.arrived == self.count:
+                self.all_arrived.set()
+        return self.all_arrived.wait(self.timeout)
+
+    def execute(self, task, script):
+        rendezvous = self.rendezvous
+        exec script
+
+
+class ParallelScriptTasksTest(BpmnWorkflowTestCase):
+    def setUp(self):
+        self.spec = BpmnProcessSpec(name='Parallel Scripts')
+        self.split = ParallelGateway(self.spec, 'Split')
+        self.join = ParallelGateway(self.spec, 'Join')
+        self.spec.start.connect(self.split)
+        self.join.connect(self.spec.end)
+
+    def _add_script(self, name, script):
+        script = ScriptTask(self.spec, name, script)
+        self.split.connect(script)
+        script.connect(self.join)
+        return script
+
+    def _add_scripts(self):
+        for i in range(4):
+            self._add_script('Script %d' % i, 'task.set_attribute(overlapped=rendezvous())')
+
+    def _run(self, script_engine):
+        self.workflow = BpmnWorkflow(self.spec, script_engine=script_engine)
+        completed = []
+        for task_spec in self.spec.task_specs.itervalues():
+            task_spec.completed_event.connect(lambda workflow, task: completed.append(task.get_name()))
+        pool = ThreadPool(4)
+        try:
+            self.workflow.do_engine_steps(pool=pool)
+        finally:
+            pool.close()
+        return completed
+
+    def _get_task(self, name):
+        return [t for t in self.workflow.get_tasks() if t.get_name() == name][0]
+
+    def testRunThroughSerial(self):
+        self._add_scripts()
+        self.workflow = BpmnWorkflow(self.spec, script_engine=_RendezvousScriptEngine(4, 0))
+        self.workflow.do_engine_steps()
+        self.assertTrue(self.workflow.is_completed())
+
+        # Only the last script finds all scripts started.
+        overlapped = [self._get_task('Script %d' % i).get_attribute('overlapped') for i in range(4)]
+        self.assertEquals([False, False, False, True], overlapped)
+
+    def testRunThroughPool(self):
+        self._add_scripts()
+        completed = self._run(_RendezvousScriptEngine(4, 10))
+        self.assertTrue(self.workflow.is_completed())
+
+        # The tasks are completed in the same order as without the pool.
+        self.assertEquals(['Start', 'Split', 'Script 0', 'Script 1', 'Script 2', 'Script 3'], completed[:6])
+        for task in self.workflow.get_tasks():
+            self.assertFalse(task._prepared)
+            self.assertEquals({}, task.__dict__)
+            if task.get_name().startswith('Script '):
+                self.assertTrue(task.get_attribute('overlapped'))
+
+    def testRunThroughPoolError(self):
+        self._add_script('Script 0', 'task.set_attribute(done=True)')
+        self._add_script('Script 1', 'raise ValueError("Script 1 failed")')
+        self._add_script('Script 2', 'task.set_attribute(done=True)')
+
+        # The error is raised when the failing task is completed, and the
+        # tasks after it are not completed.
+        completed = []
+        self.assertRaises(ValueError, lambda: completed.extend(self._run(BpmnScriptEngine())))
+        self.assertTrue(self._get_task('Script 0')._has_state(Task.COMPLETED))
+        self.assertTrue(self._get_task('Script 1')._has_state(Task.COMPLETED))
+        self.assertTrue(self._get_task('Script 2')._has_state(Task.READY))
+
+        # The prepared task is completed without running its script again.
+        script_2 = self._get_task('Script 2')
+        script_2.set_attribute(done=False)
+        self.workflow.do_engine_steps()
+        self.assertTrue(script_2._has_state(Task.COMPLETED))
+        self.assertFalse(script_2.get_attribute('done'))
+
+    def testRunThroughPoolTimeout(self):
+        for i in range(4):
+            self._add_script('Script %d' % i, 'task.set_attribute(runs=task.get_attribute("runs", 0) + 1)')
+
+        # No task is left prepared when the time is up, so the workflow
+        # can be saved and restored between the calls.
+        self.workflow = BpmnWorkflow(self.spec)
+        pool = ThreadPool(4)
+        try:
+            while self.workflow.do_engine_steps(timeout=0, pool=pool):
+                for task in self.workflow.get_tasks():
+                    self.assertFalse(task._prepared)
+                self.workflow = pickle.loads(pickle.dumps(self.workflow))
+        finally:
+            pool.close()
+        self.assertTrue(self.workflow.is_completed())
+        for i in range(4):
+            self.assertEquals(1, self._get_task('Script %d' % i).get_attribute('runs'))
+
+    def testRunThroughPoolErrorPickle(self):
+        self._add_script('Script 0', 'task.set_attribute(done=True)')
+        self._add_script('Script 1', 'raise ValueError("Script 1 failed")')
+        self._add_script('Script 2', 'task.set_attribute(done=True)')
+        self._add_script('Script 3', 'raise ValueError("Script 3 failed")')
+
+        # The errors of the tasks that are still READY are not saved.
+        self.workflow = BpmnWorkflow(self.spec)
+        pool = ThreadPool(4)
+        try:
+            self.assertRaises(ValueError, self.workflow.do_engine_steps, pool=pool)
+        finally:
+            pool.close()
+        self.assertTrue(self._get_task('Script 3')._prepared)
+        self.workflow = pickle.loads(pickle.dumps(self.workflow))
+        for task in self.workflow.get_tasks():
+            self.assertFalse(task._prepared)
+
+        # Script 3 runs again when it is completed.
+        script_3 = self._get_task('Script 3')
+        self.assertRaises(ValueError, script_3.complete)
+
+    def testRunThroughPoolCancelled(self):
+        self._add_script('Script 0', 'task.set_attribute(done=True)')
+        end = EndEvent(self.spec, 'Terminate', is_terminate_event=True)
+        self.split.connect(end)
+        self._add_script('Script 1', 'task.set_attribute(done=True)')
+
+        # A task that may cancel its siblings is not prepared ahead, so
+        # the script of the cancelled task never runs.
+        completed = self._run(BpmnScriptEngine())
+        self.assertEquals(['Start', 'Split', 'Script 0', 'Terminate'], completed[:4])
+        script_1 = self._get_task('Script 1')
+        self.assertTrue(script_1._has_state(Task.CANCELLED))
+        self.assertEquals(None, script_1.get_attribute('done'))
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromModule(sys.modules[__name__])
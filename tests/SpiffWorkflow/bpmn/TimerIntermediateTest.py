@@ -1,8 +1,10 @@
 import unittest
 import datetime
+import threading
 import time
 from SpiffWorkflow.Task import Task
 from SpiffWorkflow.bpmn.BpmnWorkflow import BpmnWorkflow
+from SpiffWorkflow.bpmn.BpmnWorkflowRunner import BpmnWorkflowRunner
 from tests.SpiffWorkflow.bpmn.BpmnWorkflowTestCase import BpmnWorkflowTestCase
 
 __author__ = 'matth'
@@ -37,6 +39,41 @@ class TimerIntermediateTest(BpmnWorkflowTestCase):
         self.workflow.do_engine_steps()
         self.assertEquals(0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
 
+    def testRunWithRunner(self):
+
+        self.workflow = BpmnWorkflow(self.spec)
+
+        due_time = datetime.datetime.now() + datetime.timedelta(seconds=0.5)
+        self.workflow.get_tasks(Task.READY)[0].set_attribute(due_time=due_time)
+
+        runner = BpmnWorkflowRunner()
+        runner.add(self.workflow)
+        self.assertTrue(runner.run())
+        self.assertTrue(datetime.datetime.now() > due_time)
+        self.assertEquals(0, len(self.workflow.get_tasks(Task.READY | Task.WAITING)))
+
+    def testRunWithRunnerWithoutThreads(self):
+
+        due_time = datetime.datetime.now() + datetime.timedelta(seconds=0.5)
+        runner = BpmnWorkflowRunner()
+        workflows = []
+        for i in range(20):
+            workflow = BpmnWorkflow(self.spec)
+            workflow.get_tasks(Task.READY)[0].set_attribute(due_time=due_time)
+            runner.add(workflow)
+            workflows.append(workflow)
+
+        # The timers are kept by the runner, not by sleeping threads.
+        n_threads = threading.active_count()
+        self.assertFalse(runner.run(timeout=0))
+        self.assertEquals(20, len(runner._timers))
+        self.assertEquals(n_threads, threading.active_count())
+
+        self.assertTrue(runner.run())
+        self.assertTrue(datetime.datetime.now() > due_time)
+        for workflow in workflows:
+            self.assertEquals(0, len(workflow.get_tasks(Task.READY | Task.WAITING)))
+
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TimerIntermediateTest)
 if __name__ == '__main__':
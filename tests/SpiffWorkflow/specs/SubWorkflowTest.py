@@ -113,6 +113,73 @@ class TaskSpecTest(unittest.TestCase):
         self.do_next_unique_task('last')
         self.do_next_unique_task('End')
 
+    def test_subworkflow_is_completed(self):
+        self.load_workflow_spec('data', 'block_to_subworkflow.xml')
+        self.do_next_unique_task('Start')
+        self.do_next_unique_task('first')
+        task = self.workflow.get_tasks(Task.READY)[0]
+        self.do_next_unique_task('sub_workflow_1')
+        subworkflow = task._get_internal_attribute('subworkflow')
+        completed = []
+        subworkflow.completed_event.connect(completed.append)
+
+        # The unfinished tasks of the subworkflow count for both workflows.
+        for name in ('Start', 'first', 'last'):
+            self.do_next_unique_task(name)
+            self.assertFalse(subworkflow.is_completed())
+            self.assertFalse(self.workflow.is_completed())
+        self.do_next_unique_task('End')
+        self.assert_(subworkflow.is_completed())
+        self.assertEqual(completed, [subworkflow])
+        self.assertFalse(self.workflow.is_completed())
+        self.do_next_unique_task('last')
+        self.do_next_unique_task('End')
+        self.assert_(self.workflow.is_completed())
+        self.assertEqual(self.workflow.get_tasks(Task.NOT_FINISHED_MASK), [])
+
+    def test_subworkflow_compacted(self):
+        self.load_workflow_spec('data', 'block_to_subworkflow.xml')
+        self.do_next_unique_task('Start')
+        self.do_next_unique_task('first')
+        task = self.workflow.get_tasks(Task.READY)[0]
+        self.do_next_unique_task('sub_workflow_1')
+        subworkflow = task._get_internal_attribute('subworkflow')
+        self.assertEqual(self.workflow._subworkflows, [subworkflow])
+
+        # A completed subworkflow is no longer searched for unfinished
+        # tasks, but its tasks are still found.
+        for name in ('Start', 'first', 'last', 'End'):
+            self.do_next_unique_task(name)
+        self.assertEqual(self.workflow._subworkflows, [])
+        self.assertEqual(self.workflow._finished_subworkflows, [subworkflow])
+        self.assert_(subworkflow.task_tree.children[0] in self.workflow.get_tasks(Task.COMPLETED))
+        self.do_next_unique_task('last')
+        self.do_next_unique_task('End')
+
+        # Once its tasks are archived, it is no longer searched at all.
+        self.assert_(self.workflow.compact() > 0)
+        self.assertEqual(self.workflow._finished_subworkflows, [])
+        self.assertEqual(subworkflow._merged_into, None)
+        self.assert_(self.workflow.is_completed())
+        for task in self.workflow.get_tasks():
+            self.assert_(task.workflow is self.workflow)
+
+    def test_subworkflow_dropped(self):
+        self.load_workflow_spec('data', 'block_to_subworkflow.xml')
+        self.do_next_unique_task('Start')
+        self.do_next_unique_task('first')
+        task = self.workflow.get_tasks(Task.READY)[0]
+        self.do_next_unique_task('sub_workflow_1')
+        subworkflow = task._get_internal_attribute('subworkflow')
+        self.assertEqual(self.workflow._subworkflows, [subworkflow])
+
+        # Dropping the unfinished tasks of the subworkflow removes it.
+        task._drop_children()
+        self.assertEqual(self.workflow._subworkflows, [])
+        self.assertEqual(self.workflow._finished_subworkflows, [])
+        self.assertEqual(subworkflow._merged_into, None)
+        self.assertEqual(self.workflow.get_tasks(Task.NOT_FINISHED_MASK), [])
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TaskSpecTest)
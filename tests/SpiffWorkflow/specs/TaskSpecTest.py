@@ -4,7 +4,10 @@ import re
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
-from SpiffWorkflow.specs import WorkflowSpec, Simple, Join
+from SpiffWorkflow import Workflow
+from SpiffWorkflow.specs import WorkflowSpec, Simple, Join, ExclusiveChoice
+from SpiffWorkflow.operators import Equal, Attrib
+from SpiffWorkflow.Task import Task
 from SpiffWorkflow.exceptions import WorkflowException
 from SpiffWorkflow.specs.TaskSpec import TaskSpec
 from SpiffWorkflow.storage import DictionarySerializer
@@ -57,6 +60,21 @@ class TaskSpecTest(unittest.TestCase):
         self.assertEqual(spec.outputs, [self.spec])
         self.assertEqual(self.spec.inputs, [spec])
 
+    def testIsFrozen(self):
+        spec = self.create_instance()
+        self.wf_spec.start.connect(self.spec)
+        self.spec.connect(spec)
+        self.assertEqual(self.spec.is_frozen(), False)
+        self.wf_spec.freeze()
+        self.assertEqual(self.spec.is_frozen(), True)
+        self.assertEqual(self.spec.outputs, (spec,))
+
+        # Neither the graph nor the attributes can be changed.
+        self.assertRaises(WorkflowException, self.spec.connect, spec)
+        self.assertRaises(WorkflowException, self.spec.set_property, a=1)
+        self.assertRaises(WorkflowException, setattr, self.spec, 'name', 'x')
+        self.assertRaises(TypeError, self.spec.properties.update, a=1)
+
     def testTest(self):
         # Should fail because the TaskSpec has no id yet.
         spec = self.create_instance()
@@ -115,6 +133,49 @@ class TaskSpecTest(unittest.TestCase):
         self.assertEquals(T1.ancestors(), [self.wf_spec.start])
         self.assertEquals(T2.ancestors(), [T1, self.wf_spec.start])
 
+    def testPredictRemembered(self):
+        class CountingSimple(Simple):
+            predictions = 0
+            def _predict_hook(self, my_task):
+                self.predictions += 1
+                Simple._predict_hook(self, my_task)
+            def _has_static_prediction(self):
+                return True
+
+        choice = ExclusiveChoice(self.wf_spec, 'choice')
+        T1 = Simple(self.wf_spec, 'T1')
+        T2 = CountingSimple(self.wf_spec, 'T2')
+        T3 = Simple(self.wf_spec, 'T3')
+        choice.follow(self.wf_spec.start)
+        choice.connect(T1)
+        choice.connect_if(Equal(Attrib('foo'), 'bar'), T2)
+        T3.follow(T2)
+        workflow = Workflow(self.wf_spec)
+        task = [t for t in workflow.get_tasks() if t.task_spec is T2][0]
+        self.assertEqual(task.state, Task.MAYBE)
+
+        # Predicting an unchanged branch again does nothing.
+        T2._predict(task)
+        predictions = T2.predictions
+        T2._predict(task)
+        T2._predict(task)
+        self.assertEqual(T2.predictions, predictions)
+
+        # Any change in the branch is noticed.
+        task.children[0].set_attribute(foo='bar')
+        T2._predict(task)
+        self.assertEqual(T2.predictions, predictions + 1)
+        task.set_attribute(foo='bar')
+        T2._predict(task)
+        self.assertEqual(T2.predictions, predictions + 2)
+
+        # Specs without a static prediction are always predicted.
+        T2._has_static_prediction = lambda: False
+        task.set_attribute(foo='baz')
+        T2._predict(task)
+        T2._predict(task)
+        self.assertEqual(T2.predictions, predictions + 4)
+
 
 def suite():
     return unittest.TestLoader().loadTestsFromTestCase(TaskSpecTest)
@@ -11,7 +11,10 @@ try:
 except ImportError, e:
     from tests.SpiffWorkflow.util import track_workflow
 from SpiffWorkflow import Workflow
-from SpiffWorkflow.specs import Join, WorkflowSpec
+from SpiffWorkflow.specs import Choose, Join, MultiChoice, Simple, Trigger, \
+                                WorkflowSpec
+from SpiffWorkflow.exceptions import WorkflowException
+from SpiffWorkflow.Task import Task
 from SpiffWorkflow.storage import XmlSerializer
 
 serializer = XmlSerializer()
@@ -27,6 +30,93 @@ class WorkflowSpecTest(unittest.TestCase):
         spec = WorkflowSpec('my spec')
         self.assertEqual('my spec', spec.name)
 
+    def testFreeze(self):
+        xml_file = os.path.join(data_dir, 'spiff', 'workflow1.xml')
+        xml = open(xml_file).read()
+        wf_spec = WorkflowSpec.deserialize(serializer, xml)
+        expected = Workflow(wf_spec)
+        expected.complete_all()
+
+        # A frozen spec takes the same path, and does not change.
+        graph = wf_spec.freeze()
+        self.assert_(wf_spec.freeze() is graph)
+        before = pickle.dumps(wf_spec, -1)
+        for i in range(2):
+            workflow = Workflow(wf_spec)
+            workflow.complete_all()
+            self.assertEqual(workflow.task_tree.get_dump(),
+                             expected.task_tree.get_dump())
+        self.assertEqual(pickle.dumps(wf_spec, -1), before)
+        self.assertRaises(WorkflowException, Simple, wf_spec, 'new')
+        self.assertEqual(pickle.loads(before).is_frozen(), True)
+
+    def _create_trigger_spec(self):
+        wf_spec = WorkflowSpec()
+        choice = MultiChoice(wf_spec, 'choice')
+        task_a = Simple(wf_spec, 'task_a')
+        task_b = Simple(wf_spec, 'task_b')
+        choice.connect(task_a)
+        choice.connect(task_b)
+        choose = Choose(wf_spec, 'choose', 'choice', ['task_b'])
+        wf_spec.start.connect(choose)
+        choose.connect(choice)
+        trigger = Trigger(wf_spec, 'trigger', ['later'])
+        later = Trigger(wf_spec, 'later', [])
+        task_b.connect(trigger)
+        trigger.connect(later)
+        return wf_spec, choice, later
+
+    def testUnfrozenTriggers(self):
+        # Unless the spec is frozen, queued triggers and choices are kept
+        # in the task specs, and apply to all workflows.
+        wf_spec, choice, later = self._create_trigger_spec()
+        workflows = [Workflow(wf_spec) for i in range(2)]
+        while not later.queued:
+            workflows[0].complete_next()
+        self.assertEqual(choice.choice, ['task_b'])
+        self.assertEqual(workflows[0].task_tree.internal_attributes, {})
+
+        tasks = [t for t in workflows[1].get_tasks() if t.task_spec is choice]
+        self.assertEqual(choice._get_choice(tasks[0]), ['task_b'])
+        workflows[0].complete_all()
+        self.assertEqual(later.queued, 0)
+
+    def testFrozenTriggers(self):
+        # Queued triggers and choices are kept in the workflow that they
+        # belong to.
+        wf_spec, choice, later = self._create_trigger_spec()
+        wf_spec.freeze()
+
+        def get_names(workflow, state):
+            return sorted(t.get_name() for t in workflow.get_tasks(state))
+        def get_queued(workflow):
+            return workflow.task_tree._get_internal_attribute(
+                'queued_triggers:later')
+        workflows = [Workflow(wf_spec) for i in range(2)]
+        while 'trigger' not in get_names(workflows[0], Task.COMPLETED):
+            workflows[0].complete_next()
+        self.assertEqual(get_queued(workflows[0]), 1)
+        self.assertEqual(get_names(workflows[0], Task.COMPLETED),
+                         ['Root', 'Start', 'choice', 'choose', 'task_b',
+                          'trigger'])
+
+        workflows[1].complete_next()
+        self.assertEqual(get_queued(workflows[1]), None)
+        self.assertEqual(get_names(workflows[1], Task.READY), ['choose'])
+        tasks = [t for t in workflows[1].get_tasks() if t.task_spec is choice]
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual(choice._get_choice(tasks[0]), None)
+
+        workflows[0].complete_all()
+        self.assertEqual(get_queued(workflows[0]), None)
+
+    def testIsFrozen(self):
+        self.assertEqual(self.wf_spec.is_frozen(), False)
+        self.wf_spec.freeze()
+        self.assertEqual(self.wf_spec.is_frozen(), True)
+        self.assertEqual(self.wf_spec.start.is_frozen(), True)
+        self.assertRaises(WorkflowException, setattr, self.wf_spec, 'name', 'x')
+
     def testGetTaskSpecFromName(self):
         pass #FIXME
 
@@ -87,6 +177,39 @@ class WorkflowSpecTest(unittest.TestCase):
             workflow = Workflow(wf_spec)
             self.doPickleSingle(workflow, expected_path)
 
+    def testCompile(self):
+        start = self.wf_spec.start
+        task1 = Simple(self.wf_spec, 'First')
+        task2 = Simple(self.wf_spec, 'Second')
+        task3 = Join(self.wf_spec, 'Third')
+        start.connect(task1)
+        task1.connect(task2)
+        task2.connect(task1)
+        task2.connect(task3)
+
+        graph = self.wf_spec.compile()
+        self.assert_(self.wf_spec._get_graph() is graph)
+        self.assertEqual(graph.component[task1], graph.component[task2])
+        self.assertNotEqual(graph.component[start], graph.component[task1])
+        self.assertEqual([graph.rank[t] for t in (start, task1, task2, task3)],
+                         [0, 1, 1, 2])
+        self.assertEqual(graph.reachable[task2], set([task1, task2, task3]))
+        self.assert_(graph.can_reach(start, task3))
+        self.assertFalse(graph.can_reach(task3, task1))
+        self.assertEqual(graph.depth_first, [start, task1, task2, task3])
+        self.assertEqual(graph.get_ancestors(task3), [task2, task1, start])
+        self.assert_(graph.has_path_to(start, task3))
+        self.assertFalse(graph.has_path_to(start, task3, [task2]))
+        self.assert_(graph.has_path_to(task2, task1, [start]))
+        self.assertFalse(graph.has_path_to(start, task1, [start]))
+
+        # Connecting task specs replaces the analysis.
+        task4 = Simple(self.wf_spec, 'Fourth')
+        task3.connect(task4)
+        graph = self.wf_spec._get_graph()
+        self.assert_(graph.can_reach(start, task4))
+        self.assertEqual(task4.ancestors(), [task3, task2, task1, start])
+
     def testValidate(self):
         """
         Tests that we can detect when two wait taks are waiting on each
@@ -105,6 +228,45 @@ class WorkflowSpecTest(unittest.TestCase):
                 "again" in results)
         self.assert_("Found loop with 'First': First->Second then 'First' "
                 "again" in results)
+        self.assertEqual(len(results), 2)
+
+        # A long chain of diamonds is validated quickly, and a loop at its
+        # end is still found.
+        wf_spec = WorkflowSpec()
+        last = wf_spec.start
+        for n in range(200):
+            join = Join(wf_spec, 'join%d' % n)
+            for side in ('left', 'right'):
+                task = Simple(wf_spec, '%s%d' % (side, n))
+                last.connect(task)
+                task.connect(join)
+            last = join
+        back = Simple(wf_spec, 'back')
+        last.connect(back)
+        back.connect(last)
+        self.assertEqual(wf_spec.validate(), [
+            "Found loop with 'join199': join199->back then 'join199' again"])
+
+        # A Join that is part of two loops is reported once.
+        wf_spec = WorkflowSpec()
+        join = Join(wf_spec, 'join')
+        wf_spec.start.connect(join)
+        for name in ('x', 'y'):
+            task = Simple(wf_spec, name)
+            join.connect(task)
+            task.connect(join)
+        results = wf_spec.validate()
+        self.assertEqual(len(results), 1)
+        self.assert_(results[0].startswith("Found loop with 'join': join->"))
+
+        # A loop without a Join is valid, since no task in it waits.
+        wf_spec = WorkflowSpec()
+        task_a = Simple(wf_spec, 'a')
+        task_b = Simple(wf_spec, 'b')
+        wf_spec.start.connect(task_a)
+        task_a.connect(task_b)
+        task_b.connect(task_a)
+        self.assertEqual(wf_spec.validate(), [])
 
 
 def suite():